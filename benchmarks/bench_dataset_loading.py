@@ -0,0 +1,86 @@
+"""Dataset._process_entries against the row-by-row formatting it replaced.
+
+    python -m benchmarks.bench_dataset_loading [rows]
+"""
+from __future__ import annotations
+
+import sys
+import time
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+
+from classifier.configuration import Configuration
+from classifier.dataset import Dataset
+from classifier.dataset import DatasetEntry
+from classifier.dataset import only_strings
+
+CLASSES = ["high_yielding", "low_yielding"]
+
+
+def process_entries_rowwise(_data: pd.DataFrame, config: Configuration) -> Dataset:
+    """The implementation before vectorization, kept as the reference."""
+    has_predefined_split = "split" in _data.columns
+    classes_labels: list[str] = config.classes
+    texts = _data.drop(classes_labels + ["split"] if has_predefined_split else [], axis=1)
+    classes = _data[classes_labels]
+    splits = _data["split"].tolist() if has_predefined_split else None
+    labels: list[str] = list(texts.columns)
+
+    data: list[tuple[list[str], list[str], Optional[list[str]]]] = list(
+        zip(
+            map(lambda x: list(x[1:]), texts.itertuples()),
+            map(lambda x: list(x[1:]), classes.itertuples()),
+            *((splits,) if has_predefined_split else ())
+        )
+    )
+    items = list(
+        map(
+            lambda entry: DatasetEntry(
+                input_text=" ".join(entry[0])
+                if config.pure_text
+                else "; ".join(map(lambda x: f"{x[0]}: {x[1]}", zip(labels, entry[0]))),
+                output_text=", ".join(
+                    filter(only_strings, map(lambda arg: arg[1] if arg[0] else None, zip(entry[1], classes_labels)))
+                ),
+                split=entry[2] if has_predefined_split else None,
+            ),
+            data,
+        )
+    )
+    return Dataset(items, has_predefined_split=has_predefined_split)
+
+
+def make_frame(rows: int, pure_text: bool, seed: int = 0) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    high = rng.integers(0, 2, rows)
+    columns = {"text": [f"reaction: CC(=O)O.OC{i % 97}>>CC(=O)OC{i % 89}" for i in range(rows)]} if pure_text else {
+        "reaction": [f"CC(=O)O.OC{i % 97}>>CC(=O)OC{i % 89}" for i in range(rows)],
+        "solvent": rng.choice(["water", "ethanol", "thf"], rows),
+        "temperature": rng.integers(0, 120, rows),
+    }
+    return pd.DataFrame({**columns, "high_yielding": high, "low_yielding": 1 - high,
+                         "split": np.where(rng.random(rows) < 0.8, "train", "test")})
+
+
+def config_for(pure_text: bool) -> Configuration:
+    return Configuration({"classes": CLASSES, "pure_text": pure_text})
+
+
+def main(rows: int) -> None:
+    for pure_text in (False, True):
+        frame, config = make_frame(rows, pure_text), config_for(pure_text)
+        started = time.perf_counter()
+        reference = process_entries_rowwise(frame, config)
+        rowwise = time.perf_counter() - started
+        started = time.perf_counter()
+        vectorized = Dataset._process_entries(frame, config)
+        columnwise = time.perf_counter() - started
+        assert [entry.tuple for entry in vectorized] == [entry.tuple for entry in reference]
+        print(f"{'text' if pure_text else 'table'} format, {rows} rows: row-wise {rowwise:.2f}s, "
+              f"vectorized {columnwise:.2f}s ({rowwise / columnwise:.1f}x)")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000)
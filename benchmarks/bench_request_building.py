@@ -0,0 +1,71 @@
+"""Per-item request building: MessageCompiler against rebuilding and re-serializing every message.
+
+    python -m benchmarks.bench_request_building [items] [shots]
+"""
+from __future__ import annotations
+
+import json
+import random
+import sys
+import time
+
+from classifier.dataset import DatasetEntry
+from classifier.providers import CompletionRequest
+from classifier.providers.messages import MessageCompiler
+from classifier.templates import zero_shot_template
+
+TEMPLATE = zero_shot_template[next(iter(zero_shot_template))]
+
+
+def request_data_rebuilt(request: CompletionRequest, name: str) -> dict:
+    """How the OpenAI provider built its request data before the compiler."""
+    content = [{"role": "system", "content": TEMPLATE}]
+    for entry in request.samples:
+        content.append({"role": "user", "name": name, "content": entry.input_text})
+        content.append({"role": "assistant", "content": entry.output_text})
+    return {"question": request.question, "name": name, "request": content, "engine": request.engine}
+
+
+def request_data_compiled(compiler: MessageCompiler, request: CompletionRequest, name: str) -> dict:
+    return {
+        "question": request.question,
+        "name": name,
+        "request": compiler.messages(request.samples),
+        "engine": request.engine,
+    }
+
+
+def make_requests(items: int, shots: int, train_size: int = 200, seed: int = 0) -> list[CompletionRequest]:
+    rng = random.Random(seed)
+    train = [
+        DatasetEntry(f"reaction: CC(=O)O.OC{i}>>CC(=O)OC{i}; solvent: ethanol; temperature: {i % 120}",
+                     rng.choice(["high_yielding", "low_yielding"]))
+        for i in range(train_size)
+    ]
+    return [
+        CompletionRequest(rng.sample(train, shots), f"reaction: CCO>>CC=O{i}", "gpt-4")
+        for i in range(items)
+    ]
+
+
+def main(items: int, shots: int) -> None:
+    requests_ = make_requests(items, shots)
+    compiler = MessageCompiler("openai", TEMPLATE, name="bench")
+
+    started = time.perf_counter()
+    rebuilt = [json.dumps(request_data_rebuilt(request, "bench")).encode() for request in requests_]
+    before = time.perf_counter() - started
+    started = time.perf_counter()
+    compiled = [compiler.body(request_data_compiled(compiler, request, "bench")) for request in requests_]
+    after = time.perf_counter() - started
+
+    assert compiled == rebuilt
+    print(f"{items} requests, {shots} shots: rebuilt {before / items * 1e6:.1f}us/item, "
+          f"compiled {after / items * 1e6:.1f}us/item ({before / after:.1f}x)")
+
+
+if __name__ == "__main__":
+    main(
+        int(sys.argv[1]) if len(sys.argv) > 1 else 20_000,
+        int(sys.argv[2]) if len(sys.argv) > 2 else 20,
+    )
@@ -1,36 +1,42 @@
 from __future__ import annotations
 
 import json
+import os
 import random
 import shutil
 import time
+from concurrent.futures import FIRST_COMPLETED
+from concurrent.futures import Future
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import wait
 from pathlib import Path
 from pprint import pprint
 from sys import argv
 
 import pandas as pd
-from sklearn.metrics import accuracy_score, recall_score, precision_score, f1_score
 import requests.exceptions
 import tqdm
 from dotenv import load_dotenv
 
+from .completion_cache import CompletionCache
+from .configuration import as_bool
 from .configuration import Configuration
 from .configuration import ConfigurationError
 from .dataset import Dataset
 from .logger import logger
+from .plan import PlanEntry
+from .plan import request_hash
+from .plan import SamplingPlan
+from .results import read_answers
+from .results import ResultsWriter
 from .providers import CompletionProvider
 from .providers import CompletionRequest
-from .providers.mistral_provider import MistralCompletionProvider
-from .providers.openai_provider import OpenAICompletionProvider
-from .providers.anthropic_provider import AnthropicCompletionProvider
-from .providers.sber_provider import SberCompletionProvider
-from .providers.yandex_provider import YandexGPTCompletionProvider
-from .samplers.simple_sampler import SimpleSampler
+from .providers import CompletionResponse
+from .providers.registry import create_provider
+from .samplers.registry import create_sampler
+from .templates import zero_shot_template
+from .utils import cache_directory
 from .utils import create_result_directory
-from classifier.samplers.occurrence_sampler import OccurrenceSampler
-from classifier.samplers.strict_sampler import StrictSampler
-from classifier.samplers.tanimoto_sampler import TanimotoSampler
-from classifier.samplers.equal_sampler import EqualSampler
 
 experimental_features = {
     "smiles2image": False,
@@ -43,104 +49,239 @@ if "--experimental-s2i" in argv:
 if "--experimental-s3s" in argv:
     experimental_features["s3storage"] = True
 
+resume_path = None
+if "--resume" in argv:
+    resume_path = Path(argv[argv.index("--resume") + 1])
+
 config_path = argv[1]
 config = Configuration.load(Path(config_path))
 random.seed(int(config.seed))
 dataset = Dataset.load_path(config.dataset, config)
-splits: tuple[Dataset, Dataset] = dataset.train_test_split(test_size=config.test_size)
+splits: tuple[Dataset, Dataset] = dataset.train_test_split(test_size=config.test_size, random_state=config.seed)
 train_dataset, test_dataset = splits
 test_dataset = test_dataset[:10]  # To delete when you gonna use it!!!!!!
 
 results: list[dict] = []
-path = create_result_directory(config=config)
+if resume_path is not None:
+    path = resume_path
+    if not path.is_dir():
+        raise ValueError(f"Nothing to resume: {path} is not a directory.")
+else:
+    path = create_result_directory(config=config)
+    shutil.copy(config_path, path / "config")
 total_cost: float = 0
 
-sampler = None
-for smp in [
-    StrictSampler,
-    OccurrenceSampler,
-    TanimotoSampler,
-    EqualSampler,
-    SimpleSampler
-]:
-    if smp.name == config.get("sampler"):
-        sampler = smp()
-        sampler.configure(config)
-
-if sampler is None:
-    logger.error("No sampler specified.")
-    raise ConfigurationError("sampler")
+# Items already answered in the result directory are never requested again.
+answered, stale_answers = read_answers(path / "results.jsonl", test_dataset)
+if stale_answers:
+    logger.warning(
+        f"{stale_answers} results in {path / 'results.jsonl'} no longer match the dataset or split; "
+        f"they are ignored and their items are requested again"
+    )
+if answered:
+    logger.info(f"Resuming {path}: {len(answered)} items are already answered")
+
+sampler = create_sampler(config)
 err = None
 
 
+provider_options: list[dict] = []
+completion_cache = None
+if as_bool(config.get("completion_cache", False)):
+    cache_path = cache_directory(config, "completions") / "completions.sqlite3"
+    read_only = str(config.get("completion_cache")).lower() == "readonly"
+    if read_only and not cache_path.is_file():
+        logger.warning(f"Read-only completion cache {cache_path} does not exist, caching is disabled.")
+    else:
+        max_size = config.get("completion_cache_max_mb")
+        completion_cache = CompletionCache(
+            cache_path,
+            max_size=int(float(max_size) * 1024 * 1024) if max_size else None,
+            read_only=read_only,
+        )
+        provider_options.append({"completion_cache": completion_cache})
 if experimental_features["s3storage"]:
     from .s3storage import S3Storage
-    storage = S3Storage()
+    storage = S3Storage(
+        manifest_path=cache_directory(config, "s3") / "uploaded.txt",
+        workers=int(config.get("s3_upload_workers", 8)),
+    )
+    provider_options.append({"store_fn": storage.store})
 if experimental_features["smiles2image"]:
     from .smiles2image import Smiles2ImageConverter
-    converter = Smiles2ImageConverter(save_path=path)
+    converter = Smiles2ImageConverter(save_path=cache_directory(config, "images"))
+    provider_options.append({"vision": True, "convert_fn": converter.convert})
+provider = create_provider(config, *provider_options)
+concurrency = int(config.get("concurrency", 1))
+execution = config.get("execution", "sync")
+if execution not in ("sync", "batch") or (
+        execution == "batch" and not hasattr(provider, "get_completions_batch")):
+    logger.error(f"Execution mode {execution} is not supported by provider {config.provider}.")
+    raise ConfigurationError("execution")
+
+
+def complete(provider: CompletionProvider, request: CompletionRequest, dry_run: bool) -> CompletionResponse:
+    if not dry_run:
+        logger.debug(f'Trying to get completion for "{request.question}"')
+    completion = provider.get_completion(request, dry_run=dry_run)
+    if not dry_run:
+        logger.debug(
+            f"Successfully retrieved completion. Classes: {completion.classes}"
+        )
+    logger.debug(f"Approximate cost of request is {completion.cost:.02f} $ / € / ₽")
+    return completion
+
+
+plan = SamplingPlan.load(path / "plan.json") if (path / "plan.json").is_file() else SamplingPlan()
+planned = {entry.test_index: entry for entry in plan if entry.test_index < len(test_dataset)}
+positions = {entry.test_index: n for n, entry in enumerate(plan)}
+stale = 0
+for index, item in enumerate(tqdm.tqdm(test_dataset, desc="Sampling")):
+    if index in answered:
+        continue
+    if index in planned:
+        if planned[index].request(train_dataset, item.input_text, config.engine) is not None:
+            continue
+        stale += 1
+    sampler.configure({"class": item.classes[0],
+                       "request": item.input_text})
+    train_indices = sampler.sample_indices(train_dataset,  # + test_dataset,
+                                           test_dataset)
+    request = CompletionRequest(
+        samples=[train_dataset[i] for i in train_indices], question=item.input_text, engine=config.engine
+    )
+    planned[index] = PlanEntry(index, train_indices, request_hash(request))
+    if index in positions:
+        plan[positions[index]] = planned[index]
+    else:
+        plan.append(planned[index])
+if stale:
+    logger.warning(
+        f"{stale} planned requests in {path / 'plan.json'} no longer match the dataset, split or "
+        f"configuration; their few-shot examples were sampled again"
+    )
+
+pending_requests = [
+    CompletionRequest(
+        samples=[train_dataset[i] for i in entry.train_indices], question=test_dataset[index].input_text,
+        engine=config.engine,
+    )
+    for index, entry in planned.items() if index not in answered
+]
+provider.expect(pending_requests)
+# Only what is actually priced: the system prompt, the planned examples and the open questions.
+provider.warm_up([
+    *([zero_shot_template[config.subject]] if config.get("subject") in zero_shot_template else []),
+    *(text for request in pending_requests for entry in request.samples
+      for text in (entry.input_text, entry.output_text)),
+    *(request.question for request in pending_requests),
+])
+
+if experimental_features["smiles2image"]:
+    needed = {
+        *(train_dataset[i].input_text.removeprefix("smiles: ")
+          for index, entry in planned.items() if index not in answered
+          for i in entry.train_indices),
+        *(item.input_text.removeprefix("smiles: ")
+          for index, item in enumerate(test_dataset) if index not in answered),
+    }
+    failed_renders = converter.prerender(needed, workers=int(config.get("render_workers", os.cpu_count() or 1)))
+    if experimental_features["s3storage"]:
+        # Uploads start in the background; requests then only wait for their own images.
+        for smiles in needed.difference(failed_renders):
+            storage.store_async(converter.convert(smiles))
+
+results_writer = None
 for dry_run in [True,
                 False]:
-    for item in tqdm.tqdm(test_dataset):
-        sampler.configure({"class": item.classes[0],
-                           "request": item.input_text})
-        samples = sampler.sample(train_dataset,  # + test_dataset,
-                                 test_dataset)
-        provider: CompletionProvider | None = None
-        if config.provider == "openai":
-            provider = OpenAICompletionProvider()
-        elif config.provider == "mistral":
-            provider = MistralCompletionProvider()
-        elif config.provider == "anthropic":
-            provider = AnthropicCompletionProvider()
-        elif config.provider == "yandex":
-            provider = YandexGPTCompletionProvider()
-        elif config.provider == "sber":
-            provider = SberCompletionProvider()
-
-        if provider is None:
-            logger.error("No provider specified.")
-            raise ConfigurationError("provider")
-
-        provider.configure(config)
-        if experimental_features["s3storage"]:
-            provider.configure({"store_fn": storage.store})
-        if experimental_features["smiles2image"]:
-            provider.configure({"vision": True, "convert_fn": converter.convert})
-        try:
-            if not dry_run:
-                # time.sleep(1)
-                logger.debug(f'Trying to get completion for "{item.input_text}"')
-            completion = provider.get_completion(
-                CompletionRequest(
-                    samples=samples, question=item.input_text, engine=config.engine
-                ),
-                dry_run=dry_run,
-            )
-            if not dry_run:
-                logger.debug(
-                    f"Successfully retrieved completion. Classes: {completion.classes}"
-                )
-            logger.debug(f"Approximate cost of request is {completion.cost:.02f} $ / € / ₽")
-            if not dry_run:
-                results.append(
-                    dict(
+    in_flight: dict[Future, int] = {}
+    if not dry_run:
+        results_writer = ResultsWriter(
+            path / "results.jsonl", fsync_every=int(config.get("results_fsync_every", 16))
+        )
+
+    def collect(futures) -> None:
+        global total_cost, err
+        for future in futures:
+            index = in_flight.pop(future)
+            item = test_dataset[index]
+            try:
+                completion = future.result()
+            except requests.exceptions.RequestException as e:
+                logger.error(f"Request failed during completion generation: {e}")
+                logger.error(f"Item content: {item.input_text}")
+            except Exception as e:
+                err = err or e
+            else:
+                if not dry_run:
+                    answered[index] = dict(
                         input=item.input_text,
                         target_classes=item.classes,
                         predicted_classes=completion.classes,
                     )
+                    results_writer.write(dict(index=index, **answered[index]))
+                if completion.cost:
+                    total_cost += completion.cost
+            progress.update()
+
+    batched: dict[str, CompletionRequest] = {}
+    with ThreadPoolExecutor(max_workers=concurrency) as executor, \
+            tqdm.tqdm(total=len(test_dataset), initial=len(answered)) as progress:
+        for index, item in enumerate(test_dataset):
+            if err:
+                break
+            if index in answered:
+                continue
+            samples = [train_dataset[i] for i in planned[index].train_indices]
+            request = CompletionRequest(
+                samples=samples, question=item.input_text, engine=config.engine
+            )
+            if not dry_run and execution == "batch":
+                batched[str(index)] = request
+                continue
+            future = executor.submit(complete, provider, request, dry_run)
+            in_flight[future] = index
+            if len(in_flight) >= concurrency:
+                collect(wait(in_flight, return_when=FIRST_COMPLETED).done)
+        if batched:
+            # The job id is kept in the result directory, so --resume waits for the same job.
+            batch_path = path / "batch.json"
+            job_id = json.loads(batch_path.read_text())["id"] if batch_path.is_file() else None
+            try:
+                outcomes = provider.get_completions_batch(
+                    batched,
+                    job_id=job_id,
+                    on_submit=lambda submitted: batch_path.write_text(json.dumps({"id": submitted})),
                 )
-            if completion.cost:
-                total_cost += completion.cost
-        except requests.exceptions.ConnectionError as e:
-            logger.error(f"Connection error during completion generation: {e}")
-            logger.error(f"Item content: {item.input_text}")
-            continue
-        except Exception as e:
-            err = e
-            break
+            except Exception as e:
+                from .providers.abstract_remote_execution_provider import BatchError
+                outcomes = dict.fromkeys(batched, e)
+                # A job that ended or is unknown to the proxy cannot be picked up again.
+                response = getattr(e, "response", None)
+                if isinstance(e, BatchError) or (response is not None and response.status_code == 404):
+                    batch_path.unlink(missing_ok=True)
+            else:
+                batch_path.unlink(missing_ok=True)
+            for custom_id, outcome in outcomes.items():
+                future = Future()
+                if isinstance(outcome, Exception):
+                    future.set_exception(outcome)
+                else:
+                    future.set_result(outcome)
+                in_flight[future] = int(custom_id)
+        if err:
+            for future in list(in_flight):
+                if future.cancel():
+                    in_flight.pop(future)
+        collect(wait(in_flight).done)
+    results = [answered[index] for index in sorted(answered)]
+    if results_writer is not None:
+        results_writer.close()
 
+    if err:
+        break
     if dry_run:
+        plan.save(path / "plan.json")
         print(f"Total cost will be approximately {total_cost:.02f}$")
 
         if input("Do you want to continue? (y/n) ").lower() != "y":
@@ -149,6 +290,8 @@ for dry_run in [True,
 
 if dataset.has_predefined_split:
     if config.get("enable_metrics") and len(results) != 0:
+        from sklearn.metrics import accuracy_score, recall_score, precision_score, f1_score
+
         y_true = pd.DataFrame(results)["target_classes"].apply(
             lambda x: 1 if "".join(x).lower().replace("-", "_") == "high_yielding" else 0)
 
@@ -166,7 +309,6 @@ with open(path / "results.json", "w") as file:
         list(results),
         file,
     )
-shutil.copy(config_path, path / "config")
-logger.info(f"Total cost: {total_cost:.02f}$")
+logger.info(f"Total cost: {total_cost:.02f}$" + (f", {completion_cache}" if completion_cache is not None else ""))
 if err:
     raise err
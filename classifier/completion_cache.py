@@ -0,0 +1,100 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Any
+
+from classifier.logger import logger
+
+
+class CompletionCache:
+    """SQLite store of completion texts keyed by a hash of the request sent to the provider.
+
+    Entries are evicted least-recently-used first once their total size
+    exceeds ``max_size`` bytes. In read-only mode the file is never written.
+    """
+
+    def __init__(self, path: Path, max_size: int | None = None, read_only: bool = False):
+        self.__max_size = max_size
+        self.__read_only = read_only
+        self.__lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        if read_only:
+            self.__connection = sqlite3.connect(
+                f"file:{path}?mode=ro", uri=True, check_same_thread=False
+            )
+        else:
+            self.__connection = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+            self.__connection.execute(
+                "CREATE TABLE IF NOT EXISTS completions ("
+                "key TEXT PRIMARY KEY, text TEXT NOT NULL, size INTEGER NOT NULL, accessed REAL NOT NULL)"
+            )
+            self.__connection.execute("CREATE INDEX IF NOT EXISTS completions_accessed ON completions (accessed)")
+        self.__size = self.__connection.execute("SELECT COALESCE(SUM(size), 0) FROM completions").fetchone()[0]
+
+    @staticmethod
+    def key(provider: str, engine: str, request_data: Any) -> str:
+        return hashlib.sha256(
+            json.dumps(
+                {"provider": provider, "engine": engine, "request": request_data},
+                sort_keys=True,
+                ensure_ascii=False,
+            ).encode()
+        ).hexdigest()
+
+    def __contains__(self, key: str) -> bool:
+        with self.__lock:
+            row = self.__connection.execute("SELECT 1 FROM completions WHERE key = ?", (key,)).fetchone()
+        return row is not None
+
+    def get(self, key: str) -> str | None:
+        with self.__lock:
+            row = self.__connection.execute("SELECT text FROM completions WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            if not self.__read_only:
+                self.__connection.execute(
+                    "UPDATE completions SET accessed = ? WHERE key = ?", (time.time(), key)
+                )
+        return row[0]
+
+    def put(self, key: str, text: str) -> None:
+        if self.__read_only:
+            return
+        size = len(key) + len(text.encode())
+        with self.__lock:
+            previous = self.__connection.execute("SELECT size FROM completions WHERE key = ?", (key,)).fetchone()
+            self.__connection.execute(
+                "INSERT OR REPLACE INTO completions (key, text, size, accessed) VALUES (?, ?, ?, ?)",
+                (key, text, size, time.time()),
+            )
+            self.__size += size - (previous[0] if previous else 0)
+            self._evict()
+
+    def _evict(self) -> None:
+        if self.__max_size is None or self.__size <= self.__max_size:
+            return
+        evicted = 0
+        while self.__size > self.__max_size:
+            rows = self.__connection.execute(
+                "SELECT key, size FROM completions ORDER BY accessed LIMIT 64"
+            ).fetchall()
+            if not rows:
+                break
+            for key, size in rows:
+                self.__connection.execute("DELETE FROM completions WHERE key = ?", (key,))
+                self.__size -= size
+                evicted += 1
+                if self.__size <= self.__max_size:
+                    break
+        logger.debug(f"Evicted {evicted} completions from the cache")
+
+    def __str__(self) -> str:
+        return f"completion cache: {self.hits} hits, {self.misses} misses"
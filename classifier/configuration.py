@@ -62,3 +62,9 @@ class ConfigurationError(Exception):
 
     def __str__(self) -> str:
         return f"Configuration error: {self.field} is not present or set not properly."
+
+
+def as_bool(value: str | bool | int | None) -> bool:
+    if isinstance(value, str):
+        return value.strip().lower() not in ("", "0", "false", "no", "off")
+    return bool(value)
@@ -1,16 +1,26 @@
 from __future__ import annotations
 
+import hashlib
+import json
+import os
 from dataclasses import dataclass
 from io import StringIO
 from io import TextIOWrapper
+from itertools import repeat
 from pathlib import Path
 from typing import BinaryIO, Optional, Literal
+from typing import Iterator
+from typing import Sequence
 from typing import TypeGuard
 
+import numpy as np
 import pandas as pd
-from sklearn.model_selection import train_test_split
 
+from classifier.configuration import as_bool
 from classifier.configuration import Configuration
+from classifier.logger import logger
+from classifier.utils import cache_directory
+from classifier.utils import file_digest
 
 
 @dataclass
@@ -36,6 +46,41 @@ def only_strings(item: str | None) -> TypeGuard[str]:
     return isinstance(item, str)
 
 
+def _pack_strings(strings: list[str]) -> dict[str, np.ndarray]:
+    """Strings as one UTF-8 blob plus character offsets, loadable without pickle."""
+    return {
+        "blob": np.frombuffer("".join(strings).encode(), dtype=np.uint8),
+        "offsets": np.cumsum([0, *map(len, strings)], dtype=np.int64),
+    }
+
+
+def _unpack_strings(blob: np.ndarray, offsets: np.ndarray) -> list[str]:
+    text = blob.tobytes().decode()
+    offsets = offsets.tolist()
+    return [text[start:end] for start, end in zip(offsets[:-1], offsets[1:])]
+
+
+def _save_npz(path: Path, **arrays: np.ndarray) -> None:
+    tmp_path = path.with_suffix(f".{os.getpid()}.tmp")
+    with open(tmp_path, "wb") as file:
+        np.savez(file, **arrays)
+    os.replace(tmp_path, path)
+
+
+def _cache_key(path: Path, config: Configuration) -> str:
+    return hashlib.sha256(
+        json.dumps(
+            {
+                "source": file_digest(path),
+                "classes": config.classes,
+                "data_format": config.get("data_format", "text"),
+                "backend": config.get("dataset_backend", "list"),
+            },
+            sort_keys=True,
+        ).encode()
+    ).hexdigest()
+
+
 class Dataset(list[DatasetEntry]):
 
     def __init__(self, *args, has_predefined_split=False, **kwargs):
@@ -80,7 +125,7 @@ class Dataset(list[DatasetEntry]):
         cls,
         path: Path,
         config: dict | Configuration,
-    ) -> Dataset:
+    ) -> Dataset | ColumnarDataset:
 
         if isinstance(config, dict) and not isinstance(config, Configuration):
             config = Configuration(existing_data=config)
@@ -88,12 +133,60 @@ class Dataset(list[DatasetEntry]):
             raise TypeError(f"Invalid path: {path}.")
         if not path.is_file():
             raise ValueError(f"Not a file: {path}.")
+        if path.suffix not in (".csv", ".xlsx"):
+            raise ValueError(f"Invalid file format: {path.suffix}")
+        target = ColumnarDataset if config.get("dataset_backend") == "columnar" else cls
+
+        cache_path = None
+        if as_bool(config.get("dataset_cache", True)):
+            cache_path = cache_directory(config, "datasets") / f"{_cache_key(path, config)}.npz"
+            if cache_path.is_file():
+                try:
+                    return target.load_npz(cache_path)
+                except (OSError, ValueError, KeyError) as e:
+                    logger.warning(f"Ignoring unreadable dataset cache {cache_path}: {e}")
+
         if path.suffix == ".csv":
-            return cls.from_csv(path, config)
-        elif path.suffix == ".xlsx":
-            return cls.from_xlsx(path, config)
+            data = pd.read_csv(path)
         else:
-            raise ValueError(f"Invalid file format: {path.suffix}")
+            data = pd.read_excel(path)
+        if target is ColumnarDataset:
+            dataset = ColumnarDataset.from_frame(data, config)
+        else:
+            dataset = cls._process_entries(data, config)
+        if cache_path is not None:
+            dataset.save_npz(cache_path)
+        return dataset
+
+    def save_npz(self, path: Path) -> None:
+        inputs = _pack_strings([entry.input_text for entry in self])
+        outputs = _pack_strings([entry.output_text for entry in self])
+        splits = _pack_strings([entry.split or "" for entry in self])
+        _save_npz(
+            path,
+            input_blob=inputs["blob"],
+            input_offsets=inputs["offsets"],
+            output_blob=outputs["blob"],
+            output_offsets=outputs["offsets"],
+            split_blob=splits["blob"],
+            split_offsets=splits["offsets"],
+            has_predefined_split=np.array(self.has_predefined_split),
+        )
+
+    @classmethod
+    def load_npz(cls, path: Path) -> Dataset:
+        with np.load(path, allow_pickle=False) as data:
+            inputs = _unpack_strings(data["input_blob"], data["input_offsets"])
+            outputs = _unpack_strings(data["output_blob"], data["output_offsets"])
+            splits = _unpack_strings(data["split_blob"], data["split_offsets"])
+            has_predefined_split = bool(data["has_predefined_split"])
+        return cls(
+            [
+                DatasetEntry(input_text=input_text, output_text=output_text, split=split or None)
+                for input_text, output_text, split in zip(inputs, outputs, splits)
+            ],
+            has_predefined_split=has_predefined_split,
+        )
 
     @classmethod
     def _process_entries(
@@ -112,52 +205,46 @@ class Dataset(list[DatasetEntry]):
         splits = None
         if has_predefined_split:
             splits = _data["split"].tolist()
-        labels: list[str] = list(_data.drop(classes_labels + ["split"] if has_predefined_split else [], axis=1).columns)
+        labels: list[str] = list(texts.columns)
 
-        data: list[tuple[list[str], list[str], Optional[list[str]]]] = list(
-            zip(
-                map(lambda x: list(x[1:]), texts.itertuples()),
-                map(lambda x: list(x[1:]), classes.itertuples()),
-                *((splits,) if has_predefined_split else ())
-            )
-        )
-        items = list(
-            map(
-                lambda entry: DatasetEntry(
-                    input_text=" ".join(entry[0])
-                    if config.pure_text
-                    else (
-                        "; ".join(
-                            map(lambda x: f"{x[0]}: {x[1]}", zip(labels, entry[0]))
-                        )
-                    ),
-                    output_text=", ".join(
-                        list(
-                            filter(
-                                only_strings,
-                                map(
-                                    lambda arg: arg[1] if arg[0] else None,
-                                    zip(entry[1], classes_labels),
-                                ),
-                            )
-                        )
-                    ),
-                    split=entry[2] if has_predefined_split else None
-                ),
-                data,
+        # Whole columns are formatted at once; only the entry objects are built per row.
+        if config.pure_text:
+            parts = [texts[label] for label in labels]
+            separator = " "
+        else:
+            parts = [label + ": " + texts[label].astype(str) for label in labels]
+            separator = "; "
+        input_texts = parts[0] if parts else pd.Series("", index=_data.index, dtype=object)
+        for part in parts[1:]:
+            input_texts = input_texts + separator + part
+
+        output_texts = pd.Series("", index=_data.index, dtype=object)
+        for label in classes_labels:
+            appended = output_texts.where(output_texts == "", output_texts + ", ") + label
+            output_texts = appended.where(classes[label].astype(bool), output_texts)
+
+        items = [
+            DatasetEntry(input_text=input_text, output_text=output_text, split=split)
+            for input_text, output_text, split in zip(
+                input_texts.tolist(),
+                output_texts.tolist(),
+                splits if has_predefined_split else repeat(None),
             )
-        )
+        ]
         return cls(items, has_predefined_split=has_predefined_split)
 
     def train_test_split(
         self,
         test_size,
+        random_state: int | None = None,
     ) -> tuple[Dataset, Dataset]:
         if self.has_predefined_split:
             train = list(filter(lambda x: x.split == "train", self))
             test = list(filter(lambda x: x.split == "test", self))
         else:
-            train, test = train_test_split(self, test_size=test_size)
+            from sklearn.model_selection import train_test_split
+
+            train, test = train_test_split(self, test_size=test_size, random_state=random_state)
         return Dataset(train), Dataset(test)
 
     def tuples(self):
@@ -168,3 +255,191 @@ class Dataset(list[DatasetEntry]):
             return Dataset(list.__getitem__(self, idx))
         else:
             return list.__getitem__(self, idx)
+
+
+SPLITS: tuple[str | None, ...] = (None, "train", "test")
+
+
+class DatasetEntryView:
+    """Read-only ``DatasetEntry`` lookalike for one row of a ``ColumnarDataset``."""
+
+    __slots__ = ("_dataset", "_index")
+
+    def __init__(self, dataset: ColumnarDataset, index: int):
+        self._dataset = dataset
+        self._index = index
+
+    @property
+    def input_text(self) -> str:
+        return self._dataset.input_text(self._index)
+
+    @property
+    def output_text(self) -> str:
+        return ", ".join(self.classes)
+
+    @property
+    def split(self) -> Optional[Literal["train"] | Literal["test"]]:
+        return self._dataset.split(self._index)
+
+    @property
+    def features(self) -> list[str]:
+        return self._dataset.features(self._index)
+
+    @property
+    def classes(self) -> list[str]:
+        return self._dataset.classes(self._index)
+
+    @property
+    def tuple(self):
+        return self.input_text, self.output_text
+
+    def __repr__(self) -> str:
+        return f"DatasetEntryView(input_text={self.input_text!r}, output_text={self.output_text!r})"
+
+
+class ColumnarDataset(Sequence[DatasetEntry]):
+    """Dataset kept as raw feature columns, a boolean class matrix and split codes.
+
+    Rows are materialized as ``DatasetEntryView`` objects only when indexed;
+    slicing and ``take`` share or gather the underlying arrays.
+    """
+
+    def __init__(
+        self,
+        feature_labels: list[str],
+        feature_values: np.ndarray,
+        class_labels: list[str],
+        class_matrix: np.ndarray,
+        split_codes: np.ndarray | None = None,
+        pure_text: bool = False,
+        has_predefined_split: bool = False,
+    ):
+        self.feature_labels = feature_labels
+        self.feature_values = feature_values
+        self.class_labels = class_labels
+        self.class_matrix = class_matrix
+        self.split_codes = split_codes
+        self.pure_text = pure_text
+        self.has_predefined_split = has_predefined_split
+
+    @classmethod
+    def from_frame(cls, data: pd.DataFrame, config: Configuration) -> ColumnarDataset:
+        has_predefined_split = "split" in data.columns
+        class_labels: list[str] = config.classes
+        texts = data.drop(class_labels + ["split"] if has_predefined_split else [], axis=1)
+        split_codes = None
+        if has_predefined_split:
+            split_codes = data["split"].map({"train": 1, "test": 2}).fillna(0).to_numpy(dtype=np.int8)
+        return cls(
+            feature_labels=list(texts.columns),
+            feature_values=texts.to_numpy(dtype=object),
+            class_labels=class_labels,
+            class_matrix=data[class_labels].astype(bool).to_numpy(),
+            split_codes=split_codes,
+            pure_text=bool(config.pure_text),
+            has_predefined_split=has_predefined_split,
+        )
+
+    def save_npz(self, path: Path) -> None:
+        # Feature cells are stored as their string form, which is all the
+        # text formatting ever uses.
+        features = _pack_strings([str(value) for value in self.feature_values.ravel()])
+        _save_npz(
+            path,
+            feature_blob=features["blob"],
+            feature_offsets=features["offsets"],
+            class_matrix=self.class_matrix,
+            split_codes=self.split_codes if self.split_codes is not None else np.zeros((0,), dtype=np.int8),
+            metadata=np.array(json.dumps({
+                "feature_labels": self.feature_labels,
+                "class_labels": self.class_labels,
+                "pure_text": self.pure_text,
+                "has_predefined_split": self.has_predefined_split,
+            })),
+        )
+
+    @classmethod
+    def load_npz(cls, path: Path) -> ColumnarDataset:
+        with np.load(path, allow_pickle=False) as data:
+            metadata = json.loads(str(data["metadata"]))
+            feature_values = np.array(
+                _unpack_strings(data["feature_blob"], data["feature_offsets"]), dtype=object
+            ).reshape(-1, len(metadata["feature_labels"]))
+            class_matrix = data["class_matrix"]
+            split_codes = data["split_codes"] if metadata["has_predefined_split"] else None
+        return cls(
+            feature_labels=metadata["feature_labels"],
+            feature_values=feature_values,
+            class_labels=metadata["class_labels"],
+            class_matrix=class_matrix,
+            split_codes=split_codes,
+            pure_text=metadata["pure_text"],
+            has_predefined_split=metadata["has_predefined_split"],
+        )
+
+    def _with_rows(self, rows: slice | np.ndarray) -> ColumnarDataset:
+        return ColumnarDataset(
+            self.feature_labels,
+            self.feature_values[rows],
+            self.class_labels,
+            self.class_matrix[rows],
+            self.split_codes[rows] if self.split_codes is not None else None,
+            self.pure_text,
+        )
+
+    def take(self, indices: Sequence[int] | np.ndarray) -> ColumnarDataset:
+        return self._with_rows(np.asarray(indices, dtype=np.intp))
+
+    def __len__(self) -> int:
+        return self.feature_values.shape[0]
+
+    def __getitem__(self, idx):
+        if isinstance(idx, slice):
+            return self._with_rows(idx)
+        if idx < 0:
+            idx += len(self)
+        if not 0 <= idx < len(self):
+            raise IndexError("ColumnarDataset index out of range")
+        return DatasetEntryView(self, idx)
+
+    def __iter__(self) -> Iterator[DatasetEntryView]:
+        return (DatasetEntryView(self, i) for i in range(len(self)))
+
+    def input_text(self, index: int) -> str:
+        if self.pure_text:
+            return " ".join(self.feature_values[index])
+        return "; ".join(self.features(index))
+
+    def features(self, index: int) -> list[str]:
+        if self.pure_text:
+            return self.input_text(index).split("; ")
+        return [f"{label}: {value}" for label, value in zip(self.feature_labels, self.feature_values[index])]
+
+    def classes(self, index: int) -> list[str]:
+        classes = [label for label, flag in zip(self.class_labels, self.class_matrix[index]) if flag]
+        return classes or [""]
+
+    def split(self, index: int) -> Optional[Literal["train"] | Literal["test"]]:
+        if self.split_codes is None:
+            return None
+        return SPLITS[self.split_codes[index]]
+
+    def feature_column(self, position: int) -> np.ndarray:
+        return self.feature_values[:, position]
+
+    def train_test_split(
+        self,
+        test_size,
+        random_state: int | None = None,
+    ) -> tuple[ColumnarDataset, ColumnarDataset]:
+        if self.has_predefined_split:
+            train = np.flatnonzero(self.split_codes == SPLITS.index("train"))
+            test = np.flatnonzero(self.split_codes == SPLITS.index("test"))
+        else:
+            from sklearn.model_selection import train_test_split
+
+            train, test = train_test_split(np.arange(len(self)), test_size=test_size, random_state=random_state)
+        return self.take(train), self.take(test)
+
+    def tuples(self):
+        return list(map(lambda x: x.tuple, self))
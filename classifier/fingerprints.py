@@ -0,0 +1,302 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Iterator
+from typing import Sequence
+
+import numpy as np
+import rdkit
+from rdkit.Chem import rdChemReactions
+from rdkit.DataStructs.cDataStructs import ConvertToNumpyArray
+
+from classifier.dataset import ColumnarDataset
+from classifier.dataset import DatasetEntry
+from classifier.logger import logger
+from classifier.utils import file_digest
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+FINGERPRINT_BITS = 4096  # CreateStructuralFingerprintForReaction default size
+FINGERPRINT_PARAMS = {"kind": "structural", "bits": FINGERPRINT_BITS, "rdkit": rdkit.__version__}
+
+_POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+_CHUNK_ROWS = 8192
+
+
+def reaction_smarts(entry: DatasetEntry) -> str:
+    return entry.features[0].lstrip('reaction: ')
+
+
+def reaction_smarts_list(train: Sequence[DatasetEntry]) -> list[str]:
+    if isinstance(train, ColumnarDataset) and not train.pure_text:
+        label = train.feature_labels[0]
+        return [f"{label}: {value}".lstrip('reaction: ') for value in train.feature_column(0)]
+    return [reaction_smarts(entry) for entry in train]
+
+
+def reaction_fingerprint(smarts: str) -> np.ndarray:
+    """Structural reaction fingerprint packed into bytes (8 bits per byte)."""
+    rxn = rdChemReactions.ReactionFromSmarts(smarts)
+    fp = rdChemReactions.CreateStructuralFingerprintForReaction(rxn)
+    bits = np.zeros((fp.GetNumBits(),), dtype=np.uint8)
+    ConvertToNumpyArray(fp, bits)
+    return np.packbits(bits)
+
+
+def _featurize_chunk(smarts: list[str]) -> tuple[bytes, list[int]]:
+    fingerprints = np.zeros((len(smarts), FINGERPRINT_BITS // 8), dtype=np.uint8)
+    failed = []
+    for i, item in enumerate(smarts):
+        try:
+            fingerprints[i] = reaction_fingerprint(item)
+        except Exception:
+            failed.append(i)
+    return fingerprints.tobytes(), failed
+
+
+def featurize(
+    smarts: list[str],
+    workers: int = 1,
+    chunk_size: int = 2048,
+) -> tuple[np.ndarray, list[int]]:
+    """Fingerprint reactions, in chunks across ``workers`` processes when ``workers > 1``.
+
+    Returns the packed fingerprint matrix and the positions that could not be
+    parsed; their rows are left empty.
+    """
+    chunks = [smarts[start:start + chunk_size] for start in range(0, len(smarts), chunk_size)]
+    if workers > 1 and len(chunks) > 1:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            results = list(executor.map(_featurize_chunk, chunks))
+    else:
+        results = list(map(_featurize_chunk, chunks))
+
+    fingerprints = np.zeros((len(smarts), FINGERPRINT_BITS // 8), dtype=np.uint8)
+    failed = []
+    for n, (data, chunk_failed) in enumerate(results):
+        start = n * chunk_size
+        block = np.frombuffer(data, dtype=np.uint8).reshape(-1, FINGERPRINT_BITS // 8)
+        fingerprints[start:start + block.shape[0]] = block
+        failed += [start + i for i in chunk_failed]
+
+    if failed:
+        logger.warning(
+            f"Failed to parse {len(failed)} of {len(smarts)} reactions, they will never be sampled. "
+            f"First ones: {[smarts[i] for i in failed[:5]]}"
+        )
+    return fingerprints, failed
+
+
+def popcount(fingerprints: np.ndarray) -> np.ndarray:
+    counts = np.empty((fingerprints.shape[0],), dtype=np.uint32)
+    for start in range(0, fingerprints.shape[0], _CHUNK_ROWS):
+        block = fingerprints[start:start + _CHUNK_ROWS]
+        counts[start:start + _CHUNK_ROWS] = _POPCOUNT[block].sum(axis=1, dtype=np.uint32)
+    return counts
+
+
+class ReactionFingerprintIndex:
+    """Packed-bit fingerprint matrix of a train set, queried with one vectorized Tanimoto pass.
+
+    ``rows`` maps train positions onto rows of ``fingerprints`` when the matrix
+    is shared (e.g. a memory-mapped store); by default row ``i`` is train item ``i``.
+    Rows marked in ``invalid`` could not be parsed and are never returned.
+    """
+
+    def __init__(
+        self,
+        smarts: list[str],
+        fingerprints: np.ndarray,
+        counts: np.ndarray | None = None,
+        rows: np.ndarray | None = None,
+        invalid: np.ndarray | None = None,
+    ):
+        self.__smarts = smarts
+        self.__fingerprints = fingerprints
+        self.__counts = popcount(fingerprints) if counts is None else counts
+        self.__rows = rows
+        self.__positions: dict[str, list[int]] = {}
+        for i, item in enumerate(smarts):
+            self.__positions.setdefault(item, []).append(i)
+        if invalid is not None and rows is not None:
+            invalid = invalid[rows]
+        self.__invalid = np.flatnonzero(invalid) if invalid is not None else np.zeros((0,), dtype=np.intp)
+
+    @classmethod
+    def build(
+        cls,
+        train: Sequence[DatasetEntry],
+        workers: int = 1,
+        chunk_size: int = 2048,
+    ) -> ReactionFingerprintIndex:
+        smarts = reaction_smarts_list(train)
+        fingerprints, failed = featurize(smarts, workers, chunk_size)
+        invalid = np.zeros((len(smarts),), dtype=bool)
+        invalid[failed] = True
+        return cls(smarts, fingerprints, invalid=invalid)
+
+    def __len__(self) -> int:
+        return len(self.__smarts)
+
+    def similarities(self, query: np.ndarray) -> np.ndarray:
+        n_rows = self.__fingerprints.shape[0]
+        common = np.empty((n_rows,), dtype=np.uint32)
+        for start in range(0, n_rows, _CHUNK_ROWS):
+            block = self.__fingerprints[start:start + _CHUNK_ROWS]
+            common[start:start + _CHUNK_ROWS] = _POPCOUNT[block & query].sum(axis=1, dtype=np.uint32)
+        union = self.__counts + np.uint32(_POPCOUNT[query].sum()) - common
+        similarities = np.divide(
+            common, union, out=np.zeros((n_rows,), dtype=np.float64), where=union > 0
+        )
+        if self.__rows is not None:
+            similarities = similarities[self.__rows]
+        return similarities
+
+    def top_k(self, smarts: str, k: int) -> list[int]:
+        """Indices of the k most similar train reactions, most similar first.
+
+        Reactions identical to the query are skipped; ties keep train order.
+        """
+        similarities = self.similarities(reaction_fingerprint(smarts))
+        similarities[self.__invalid] = -np.inf
+        similarities[self.__positions.get(smarts, [])] = -np.inf
+        k = min(int(k), int(np.count_nonzero(similarities > -np.inf)))
+        if k <= 0:
+            return []
+
+        threshold = np.partition(similarities, len(self) - k)[len(self) - k]
+        candidates = np.flatnonzero(similarities >= threshold)
+        order = np.lexsort((candidates, -similarities[candidates]))
+        return candidates[order[:k]].tolist()
+
+
+class ReactionFingerprintStore:
+    """On-disk fingerprint matrix of one dataset file, shared read-only through ``mmap``.
+
+    The store is keyed by the dataset file content and ``FINGERPRINT_PARAMS``.
+    ``<key>.json`` lists the stored reactions and names the immutable matrix
+    file they belong to, so readers never observe a half-written store.
+    """
+
+    def __init__(
+        self,
+        directory: Path,
+        dataset_path: Path,
+        workers: int = 1,
+        chunk_size: int = 2048,
+    ):
+        self.__directory = directory
+        self.__workers = workers
+        self.__chunk_size = chunk_size
+        self.__key = hashlib.sha256(
+            json.dumps(
+                {"dataset": file_digest(dataset_path), "fingerprint": FINGERPRINT_PARAMS},
+                sort_keys=True,
+            ).encode()
+        ).hexdigest()
+
+    @property
+    def _manifest_path(self) -> Path:
+        return self.__directory / f"{self.__key}.json"
+
+    @contextmanager
+    def _locked(self) -> Iterator[None]:
+        """Exclusive lock over the store, held by ``index`` from reading the manifest until a new
+        version is saved and the superseded one is removed."""
+        with open(self.__directory / f"{self.__key}.lock", "a") as file:
+            if fcntl is not None:
+                fcntl.flock(file.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(file.fileno(), fcntl.LOCK_UN)
+
+    def _load_version(self, manifest: dict) -> tuple[list[str], np.ndarray, np.ndarray, np.ndarray]:
+        return (
+            manifest["smarts"],
+            np.load(self.__directory / manifest["fingerprints"], mmap_mode="r"),
+            np.load(self.__directory / manifest["counts"], mmap_mode="r"),
+            np.load(self.__directory / manifest["invalid"], mmap_mode="r"),
+        )
+
+    def load(self) -> tuple[list[str], np.ndarray, np.ndarray, np.ndarray] | None:
+        try:
+            return self._load_version(json.loads(self._manifest_path.read_text()))
+        except (OSError, ValueError, KeyError) as e:
+            if self._manifest_path.exists():
+                logger.warning(f"Ignoring unreadable fingerprint store {self._manifest_path}: {e}")
+            return None
+
+    def save(
+        self,
+        smarts: list[str],
+        fingerprints: np.ndarray,
+        counts: np.ndarray,
+        invalid: np.ndarray,
+    ) -> tuple[list[str], np.ndarray, np.ndarray, np.ndarray]:
+        """Write a new version and point the manifest at it; returns that version, memory-mapped."""
+        version = hashlib.sha256("\n".join(smarts).encode()).hexdigest()[:16]
+        names = {
+            "fingerprints": f"{self.__key}.{version}.fp.npy",
+            "counts": f"{self.__key}.{version}.counts.npy",
+            "invalid": f"{self.__key}.{version}.invalid.npy",
+        }
+        for field, array in (("fingerprints", fingerprints), ("counts", counts), ("invalid", invalid)):
+            tmp_path = self.__directory / f"{names[field]}.{os.getpid()}.tmp"
+            with open(tmp_path, "wb") as file:
+                np.save(file, np.ascontiguousarray(array))
+            os.replace(tmp_path, self.__directory / names[field])
+
+        try:
+            previous = json.loads(self._manifest_path.read_text())
+        except (OSError, ValueError):
+            previous = {}
+        tmp_path = self._manifest_path.with_suffix(f".{os.getpid()}.tmp")
+        tmp_path.write_text(json.dumps({"smarts": smarts, **names}))
+        os.replace(tmp_path, self._manifest_path)
+
+        stored = self._load_version({"smarts": smarts, **names})
+        # Readers only open versions while holding the lock, and mapped copies stay valid after
+        # unlinking; without flock (Windows) superseded versions are kept instead.
+        for field, name in names.items():
+            if fcntl is not None and isinstance(previous.get(field), str) and previous[field] != name:
+                try:
+                    (self.__directory / previous[field]).unlink(missing_ok=True)
+                except OSError as e:
+                    logger.debug(f"Could not remove superseded fingerprint file {previous[field]}: {e}")
+        return stored
+
+    def index(self, train: Sequence[DatasetEntry]) -> ReactionFingerprintIndex:
+        smarts = reaction_smarts_list(train)
+        with self._locked():
+            stored = self.load()
+            known, fingerprints, counts, invalid = stored if stored is not None else ([], None, None, None)
+            rows_of = {item: i for i, item in enumerate(known)}
+
+            missing = [item for item in dict.fromkeys(smarts) if item not in rows_of]
+            if missing:
+                logger.info(f"Fingerprinting {len(missing)} reactions missing from {self._manifest_path}")
+                new_fingerprints, failed = featurize(missing, self.__workers, self.__chunk_size)
+                new_invalid = np.zeros((len(missing),), dtype=bool)
+                new_invalid[failed] = True
+                if fingerprints is not None:
+                    new_fingerprints = np.concatenate([fingerprints, new_fingerprints])
+                    new_invalid = np.concatenate([invalid, new_invalid])
+                known, fingerprints, counts, invalid = self.save(
+                    known + missing, new_fingerprints, popcount(new_fingerprints), new_invalid
+                )
+                rows_of = {item: i for i, item in enumerate(known)}
+
+        if fingerprints is None:
+            return ReactionFingerprintIndex(smarts, np.zeros((0, FINGERPRINT_BITS // 8), dtype=np.uint8))
+        rows = np.fromiter((rows_of[item] for item in smarts), dtype=np.intp, count=len(smarts))
+        return ReactionFingerprintIndex(smarts, fingerprints, counts, rows, invalid)
@@ -0,0 +1,53 @@
+from __future__ import annotations
+
+import hashlib
+import json
+from dataclasses import asdict
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Sequence
+
+from classifier.dataset import DatasetEntry
+from classifier.providers import CompletionRequest
+
+
+def request_hash(request: CompletionRequest) -> str:
+    return hashlib.sha256(
+        json.dumps(
+            {
+                "engine": request.engine,
+                "question": request.question,
+                "samples": [entry.tuple for entry in request.samples],
+            },
+            ensure_ascii=False,
+        ).encode()
+    ).hexdigest()
+
+
+@dataclass
+class PlanEntry:
+    test_index: int
+    train_indices: list[int]
+    request_hash: str
+
+    def request(self, train: Sequence[DatasetEntry], question: str, engine: str) -> CompletionRequest | None:
+        """The planned request, or ``None`` when the dataset, split or config no longer produce it."""
+        if any(not 0 <= i < len(train) for i in self.train_indices):
+            return None
+        request = CompletionRequest(
+            samples=[train[i] for i in self.train_indices], question=question, engine=engine
+        )
+        return request if request_hash(request) == self.request_hash else None
+
+
+class SamplingPlan(list[PlanEntry]):
+    """Few-shot examples chosen for every test item, so they are sampled only once per run."""
+
+    def save(self, path: Path) -> None:
+        with open(path, "w") as file:
+            json.dump([asdict(entry) for entry in self], file)
+
+    @classmethod
+    def load(cls, path: Path) -> SamplingPlan:
+        with open(path) as file:
+            return cls(PlanEntry(**entry) for entry in json.load(file))
@@ -2,6 +2,7 @@ from __future__ import annotations
 
 import abc
 from dataclasses import dataclass
+from typing import Iterable
 
 from classifier.dataset import DatasetEntry
 
@@ -32,3 +33,11 @@ class CompletionProvider(abc.ABC):
 
     def configure(self, configuration: dict) -> None:
         pass
+
+    def warm_up(self, texts: Iterable[str]) -> None:
+        """Precompute whatever per-text data the cost estimation needs."""
+        pass
+
+    def expect(self, requests: Iterable[CompletionRequest]) -> None:
+        """Announce the requests of the run before any of them is sent."""
+        pass
@@ -1,25 +1,60 @@
 from __future__ import annotations
 
 import abc
+import dataclasses
 import json
 import math
 import os
+import threading
+import time
+from collections import Counter
 from pprint import pprint
 from typing import Any
+from typing import Callable
+from typing import Iterable
 
 import requests
 
 from . import CompletionProvider
 from . import CompletionRequest
 from . import CompletionResponse
+from .http import get_session
+from .messages import MessageCompiler
+from .rate_limit import get_rate_limiter
+from .rate_limit import RateLimiter
+from .retry import CircuitBreaker
+from .retry import get_circuit_breaker
+from .retry import RetryPolicy
+from classifier.completion_cache import CompletionCache
+from classifier.configuration import as_bool
 from classifier.configuration import ConfigurationError
 from classifier.logger import logger
+from classifier.tokens import TokenCountingProvider
 
 
-class AbstractRemoteExecutionCompletionProvider(CompletionProvider, abc.ABC):
+class InvalidResponseError(requests.RequestException):
+    """The API answered successfully, but the body is not a valid completion."""
+
+
+class BatchError(requests.RequestException):
+    """A batch job, or one request in it, did not produce a completion."""
+
+
+class AbstractRemoteExecutionCompletionProvider(TokenCountingProvider, CompletionProvider, abc.ABC):
     def __init__(self):
-        self.__retry_number = 5
+        self.__retry_policy = RetryPolicy()
+        self._circuit_breaker: CircuitBreaker | None = None
         self._API_URL = None
+        self._session: requests.Session | None = None
+        self.__cache: CompletionCache | None = None
+        self._rate_limiter: RateLimiter | None = None
+        self.__batch_poll_interval = 30.
+        self.__batch_price_factor = 0.5
+        self._prompt_cache = False
+        self._compiler: MessageCompiler | None = None
+        self.__prefix_counts: Counter[tuple] = Counter()
+        self.__seen_prefixes: Counter[tuple] = Counter()
+        self.__samples_lock = threading.Lock()
 
     @property
     @abc.abstractmethod
@@ -36,15 +71,57 @@ class AbstractRemoteExecutionCompletionProvider(CompletionProvider, abc.ABC):
             self._API_URL = "http://" + self._API_URL
         if not self._API_URL.endswith("/"):
             self._API_URL += "/"
-        tmp = configuration.get("retry_number")
-        if tmp is not None:
-            self.__retry_number = int(tmp)
+        self._session = get_session(self._API_URL, configuration)
+        self.__retry_policy.configure(configuration)
+        self._circuit_breaker = get_circuit_breaker(self._API_URL, configuration)
+        cache = configuration.get("completion_cache")
+        if isinstance(cache, CompletionCache):
+            self.__cache = cache
+        self.__batch_poll_interval = float(configuration.get("batch_poll_interval", self.__batch_poll_interval))
+        self.__batch_price_factor = float(configuration.get("batch_price_factor", self.__batch_price_factor))
+        self._prompt_cache = as_bool(configuration.get("prompt_cache", self._prompt_cache))
+        if self._rate_limiter is None:
+            self._rate_limiter = get_rate_limiter(
+                f"{self.provider}:{configuration.get('engine')}", configuration
+            )
 
     @abc.abstractmethod
     def _to_request_data(self, request: CompletionRequest) -> dict:
         """Create dict that represents the request out of CompletionRequest object"""
         pass
 
+    def _mark_prompt_cache(self, request: CompletionRequest, request_data: dict) -> dict:
+        """Add provider-side prompt caching hints to the request data, applied after the completion cache key."""
+        return request_data
+
+    def _request_body(self, request_data: dict) -> bytes | str:
+        if self._compiler is not None:
+            return self._compiler.body(request_data)
+        return json.dumps(request_data)
+
+    def expect(self, requests_: Iterable[CompletionRequest]) -> None:
+        for request in requests_:
+            self.__prefix_counts[self._prefix_key(request)] += 1
+
+    @staticmethod
+    def _prefix_key(request: CompletionRequest) -> tuple:
+        return tuple((entry.input_text, entry.output_text) for entry in request.samples)
+
+    def _shares_prefix(self, request: CompletionRequest) -> bool:
+        """Whether the few-shot block is shared with other requests of the run.
+
+        Decided by content, from the requests announced to ``expect``; blocks
+        that were not announced are shared once they are seen a second time.
+        """
+        if not request.samples:
+            return False
+        key = self._prefix_key(request)
+        with self.__samples_lock:
+            if key not in self.__prefix_counts:
+                self.__seen_prefixes[key] += 1
+                return self.__seen_prefixes[key] > 1
+            return self.__prefix_counts[key] > 1
+
     @abc.abstractmethod
     def _from_response_data(
         self, request: CompletionRequest, response: dict
@@ -52,6 +129,17 @@ class AbstractRemoteExecutionCompletionProvider(CompletionProvider, abc.ABC):
         """Create CompletionResponse object from json data of the API response."""
         pass
 
+    def _parse_response(self, request: CompletionRequest, response: Any) -> CompletionResponse:
+        try:
+            return self._from_response_data(request, response)
+        except Exception as e:
+            raise InvalidResponseError(f"Invalid {self.provider} response: {e}") from e
+
+    @abc.abstractmethod
+    def _estimate_prompt_tokens(self, request: CompletionRequest) -> int:
+        """Estimates the number of prompt tokens of the specific request"""
+        pass
+
     @abc.abstractmethod
     def _estimate_cost(self, request: CompletionRequest) -> float:
         """Estimates the cost of the specific request"""
@@ -60,26 +148,142 @@ class AbstractRemoteExecutionCompletionProvider(CompletionProvider, abc.ABC):
     def get_completion(
         self, request: CompletionRequest, dry_run: bool = False
     ) -> CompletionResponse:
-        request_dict: dict[str, Any] = self._to_request_data(request)
-        err: requests.ConnectionError | None = None
+        request_dict: dict[str, Any] | None = None
+
+        cache_key = None
+        if self.__cache is not None:
+            request_dict = self._to_request_data(request)
+            cache_key = self.__cache.key(self.provider, request.engine, request_dict)
+            if dry_run and cache_key in self.__cache:
+                return CompletionResponse(text=None, cost=0.)
+            if not dry_run:
+                text = self.__cache.get(cache_key)
+                if text is not None:
+                    logger.debug("Completion is taken from the cache")
+                    return CompletionResponse(text=text, cost=0.)
 
         if dry_run:
             return CompletionResponse(
                 text=None, cost=math.ceil(self._estimate_cost(request) * 100) / 100
             )
-        for n in range(self.__retry_number):
+        if request_dict is None:
+            request_dict = self._to_request_data(request)
+        if self._prompt_cache:
+            request_dict = self._mark_prompt_cache(request, request_dict)
+        result = self._parse_response(
+            request,
+            self._call("get", "respond", self._request_body(request_dict), self._estimate_prompt_tokens(request)),
+        )
+        if cache_key is not None:
+            self.__cache.put(cache_key, result.text)
+        return result
+
+    def _call(self, method: str, path: str, data: bytes | str | None = None, tokens: int | None = None) -> Any:
+        """Send one API call with retries, returning the decoded JSON body.
+
+        Connection errors, timeouts and retryable statuses are retried under the
+        retry policy and circuit breaker; other error statuses raise ``HTTPError``
+        at once. When ``tokens`` is given, each attempt also passes the rate limiter.
+        """
+        err: requests.RequestException | None = None
+        policy = self.__retry_policy
+        for attempt in range(policy.max_attempts):
+            self._circuit_breaker.wait()
+            if tokens is not None:
+                self._rate_limiter.acquire(tokens)
+            started, status, retry_after = time.monotonic(), None, None
             try:
-                response = requests.get(
-                    self._API_URL + "respond", data=json.dumps(request_dict)
-                )
-                result = self._from_response_data(request, response.json())
-            except requests.ConnectionError as e:
-                logger.warning("Connection failed. Retrying...")
+                response = self._session.request(method.upper(), self._API_URL + path, data=data)
+                status = response.status_code
+                if policy.is_retryable(status):
+                    retry_after = response.headers.get("Retry-After")
+                    raise requests.HTTPError(f"{status} response from the API", response=response)
+                body = response.json() if status < 400 else None
+            except (requests.ConnectionError, requests.Timeout, requests.HTTPError, requests.JSONDecodeError) as e:
+                self._circuit_breaker.record_failure()
                 err = e
-                continue
             else:
-                return result
+                self._circuit_breaker.record_success()
+                if status >= 400:
+                    # Not retryable: this call fails, the run goes on.
+                    raise requests.HTTPError(
+                        f"{status} response from the API: {response.text[:500]}", response=response
+                    )
+                return body
+            finally:
+                if tokens is not None:
+                    self._rate_limiter.release(status, time.monotonic() - started)
+            if attempt + 1 < policy.max_attempts:
+                delay = policy.delay(attempt, retry_after)
+                logger.warning(f"Request failed ({err}). Retrying in {delay:.1f}s...")
+                time.sleep(delay)
         if err:
             raise err
         else:
             raise Exception("No response")
+
+    def get_completions_batch(
+        self,
+        requests_: dict[str, CompletionRequest],
+        job_id: str | None = None,
+        on_submit: Callable[[str], None] | None = None,
+    ) -> dict[str, CompletionResponse | Exception]:
+        """Run requests as one batch job on the proxy; results are keyed by the same custom ids.
+
+        The proxy accepts ``POST batch`` with ``{"provider", "requests": [{"custom_id", "request"}]}``
+        and reports ``GET batch/<id>`` as ``{"id", "status", "results": [{"custom_id", "response" | "error"}]}``.
+        ``on_submit`` receives the id of the new job; passing it back as ``job_id`` picks that job up
+        again instead of submitting a new one. Cached requests are not sent, and batch results are
+        charged at ``batch_price_factor``.
+        """
+        outcomes: dict[str, CompletionResponse | Exception] = {}
+        cache_keys: dict[str, str | None] = {}
+        bodies = []
+        for custom_id, request in requests_.items():
+            request_dict = self._to_request_data(request)
+            cache_key = None
+            if self.__cache is not None:
+                cache_key = self.__cache.key(self.provider, request.engine, request_dict)
+                text = self.__cache.get(cache_key)
+                if text is not None:
+                    outcomes[custom_id] = CompletionResponse(text=text, cost=0.)
+                    continue
+            if self._prompt_cache:
+                request_dict = self._mark_prompt_cache(request, request_dict)
+            cache_keys[custom_id] = cache_key
+            bodies.append({"custom_id": custom_id, "request": request_dict})
+        if not bodies:
+            return outcomes
+
+        if job_id is None:
+            job = self._call("post", "batch", json.dumps({"provider": self.provider, "requests": bodies}))
+            logger.info(f"Submitted batch {job['id']} with {len(bodies)} requests")
+            if on_submit is not None:
+                on_submit(job["id"])
+        else:
+            job = self._call("get", f"batch/{job_id}")
+            logger.info(f"Resuming batch {job_id}")
+        while job["status"] not in ("completed", "failed", "expired", "cancelled"):
+            time.sleep(self.__batch_poll_interval)
+            job = self._call("get", f"batch/{job['id']}")
+        if job["status"] != "completed":
+            raise BatchError(f"Batch {job['id']} finished with status {job['status']}")
+
+        for item in job.get("results", []):
+            custom_id = item.get("custom_id")
+            if custom_id not in cache_keys:
+                continue
+            try:
+                if item.get("error") is not None:
+                    raise BatchError(f"Batch request {custom_id} failed: {item['error']}")
+                result = self._parse_response(requests_[custom_id], item["response"])
+            except requests.RequestException as e:
+                outcomes[custom_id] = e
+                continue
+            if cache_keys[custom_id] is not None:
+                self.__cache.put(cache_keys[custom_id], result.text)
+            outcomes[custom_id] = dataclasses.replace(result, cost=(result.cost or 0.) * self.__batch_price_factor)
+        for custom_id in cache_keys:
+            if custom_id not in outcomes:
+                outcomes[custom_id] = BatchError(f"Batch {job['id']} returned no result for request {custom_id}")
+        return outcomes
@@ -1,25 +1,28 @@
 from __future__ import annotations
 
 import base64
-import json
 from pathlib import Path
 from typing import Callable
 
 import magic
-import tiktoken
 
 from . import CompletionRequest
 from . import CompletionResponse
 from ..logger import logger
+from .messages import MessageCompiler
 from .abstract_remote_execution_provider import (
     AbstractRemoteExecutionCompletionProvider,
 )
 from classifier.configuration import ConfigurationError
 from classifier.templates import zero_shot_template
+from classifier.tokens import count_prompt_tokens
 
 from anthropic.types import Message
 
 
+EPHEMERAL = {"type": "ephemeral"}
+
+
 class AnthropicCompletionProvider(AbstractRemoteExecutionCompletionProvider):
     __name: str
     __template = None
@@ -39,16 +42,17 @@ class AnthropicCompletionProvider(AbstractRemoteExecutionCompletionProvider):
         self.__name = str(configuration.get("name"))
         if self.__name is None:
             raise ConfigurationError("name")
+        if self.__template in zero_shot_template:
+            self._compiler = MessageCompiler("anthropic", zero_shot_template[self.__template], name=self.__name)
 
     def _to_request_data(self, request: CompletionRequest) -> dict:
         if self.__template is None:
             raise ValueError("Enable to create request: template has not specified")
-        try:
-            content = [{"role": "system", "content": zero_shot_template[self.__template]}]
-        except KeyError:
+        if self.__template not in zero_shot_template:
             raise ValueError(f"Enable to create request: \"template\" configuration parameter is invalid. Valid "
                              f"options are: {', '.join(zero_shot_template.keys())}")
         if self.__vision:
+            content = self._compiler.messages([])
             for entry in request.samples:
                 filepath = Path(self.__convert_fn(entry.input_text.removeprefix("smiles: ")))
                 content.append({
@@ -75,12 +79,7 @@ class AnthropicCompletionProvider(AbstractRemoteExecutionCompletionProvider):
                 "request": content,
                 "engine": request.engine,
             }
-        for entry in request.samples:
-            content.append(
-                {"role": "user", "content": entry.input_text}
-            )
-            content.append({"role": "assistant", "content": entry.output_text})
-
+        content = self._compiler.messages(request.samples)
         return {
             "question": request.question,
             "name": "",
@@ -111,17 +110,27 @@ class AnthropicCompletionProvider(AbstractRemoteExecutionCompletionProvider):
     #         "name": ""
     #     }
 
+    def _mark_prompt_cache(self, request: CompletionRequest, request_data: dict) -> dict:
+        """Mark the system prompt, and the few-shot block when it repeats, as cacheable prefixes."""
+        content = list(request_data["request"])
+        content[0] = {
+            "role": "system",
+            "content": [{"type": "text", "text": content[0]["content"], "cache_control": EPHEMERAL}],
+        }
+        if self._shares_prefix(request):
+            last = content[-1]
+            content[-1] = {
+                "role": last["role"],
+                "content": [{"type": "text", "text": last["content"], "cache_control": EPHEMERAL}],
+            }
+        return {**request_data, "request": content}
+
+    def _estimate_prompt_tokens(self, request: CompletionRequest) -> int:
+        return count_prompt_tokens(zero_shot_template[self.__template], request)
+
     def _estimate_cost(self, request: CompletionRequest) -> float:
-        enc = tiktoken.get_encoding("cl100k_base")
-
-        tokens = enc.encode(
-            json.dumps(
-                self._to_request_data(request)["request"]
-                + [{"role": "user", "name": self.__name, "content": request.question}],
-                ensure_ascii=False,
-            )
-        )
-        return self._prompt_tokens_to_price(len(tokens), request.engine)
+        tokens = self._estimate_prompt_tokens(request)
+        return self._prompt_tokens_to_price(tokens, request.engine)
 
     @staticmethod
     def _prompt_tokens_to_price(tokens: int, engine: str) -> float:
@@ -155,9 +164,16 @@ class AnthropicCompletionProvider(AbstractRemoteExecutionCompletionProvider):
         if not model.content:
             raise ValueError("Model returned an invalid response")
         content = ''.join(p.text for p in model.content)
+        # input_tokens excludes cached prefix tokens: reads cost 10% of the input price, writes 125%.
+        cache_read = getattr(model.usage, "cache_read_input_tokens", None) or 0
+        cache_creation = getattr(model.usage, "cache_creation_input_tokens", None) or 0
         price = self._prompt_tokens_to_price(
             model.usage.input_tokens, request.engine
-        ) + self._completion_tokens_to_price(
+        ) + self._prompt_tokens_to_price(
+            cache_read, request.engine
+        ) * 0.1 + self._prompt_tokens_to_price(
+            cache_creation, request.engine
+        ) * 1.25 + self._completion_tokens_to_price(
             model.usage.output_tokens, request.engine
         )
 
@@ -166,7 +182,8 @@ class AnthropicCompletionProvider(AbstractRemoteExecutionCompletionProvider):
         )
 
         logger.debug(
-            f"Anthropic reported {model.usage.input_tokens} prompt tokens and {model.usage.output_tokens} "
+            f"Anthropic reported {model.usage.input_tokens} prompt tokens ({cache_read} read from and "
+            f"{cache_creation} written to the prompt cache) and {model.usage.output_tokens} "
             f"completion ({price:.4f}$) tokens. Estimation was: {self._estimate_cost(request):.4f}$"
         )
 
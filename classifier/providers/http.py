@@ -0,0 +1,39 @@
+from __future__ import annotations
+
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from classifier.configuration import as_bool
+
+_sessions: dict[str, requests.Session] = {}
+_lock = threading.Lock()
+
+
+def get_session(base_url: str, configuration: dict | None = None) -> requests.Session:
+    """Keep-alive session shared by every provider talking to ``base_url``.
+
+    The pool is set up from the first configuration that asks for it:
+    ``http_pool_connections`` (hosts kept per session), ``http_pool_maxsize``
+    (connections per host, defaults to ``concurrency``), ``http_pool_block``
+    and ``http_keep_alive``.
+    """
+    configuration = configuration or {}
+    with _lock:
+        session = _sessions.get(base_url)
+        if session is None:
+            adapter = HTTPAdapter(
+                pool_connections=int(configuration.get("http_pool_connections", 10)),
+                pool_maxsize=int(
+                    configuration.get("http_pool_maxsize", configuration.get("concurrency", 10))
+                ),
+                pool_block=as_bool(configuration.get("http_pool_block", False)),
+            )
+            session = requests.Session()
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            if not as_bool(configuration.get("http_keep_alive", True)):
+                session.headers["Connection"] = "close"
+            _sessions[base_url] = session
+    return session
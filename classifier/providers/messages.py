@@ -0,0 +1,81 @@
+from __future__ import annotations
+
+import json
+import threading
+from dataclasses import dataclass
+
+from classifier.dataset import DatasetEntry
+
+
+@dataclass(frozen=True)
+class Dialect:
+    system_role: str
+    text_key: str = "content"
+    named_user: bool = False
+
+
+DIALECTS = {
+    "openai": Dialect("system", named_user=True),
+    "anthropic": Dialect("system"),
+    "mistral": Dialect("user"),
+    "sber": Dialect("system"),
+    "yandex": Dialect("system", text_key="text"),
+}
+
+
+class MessageCompiler:
+    """Builds chat messages in a provider dialect, creating and serializing each message only once.
+
+    ``messages`` returns the memoized message dicts of the system prompt and the
+    few-shot block; ``body`` serializes request data built from them by joining
+    their cached JSON, byte for byte equal to ``json.dumps(request_data).encode()``.
+    """
+
+    def __init__(self, dialect: str, system: str, name: str | None = None):
+        self.__dialect = DIALECTS[dialect]
+        self.__name = name
+        self.__lock = threading.Lock()
+        self.__samples: dict[tuple[str, str], tuple[dict, dict]] = {}
+        self.__serialized: dict[int, bytes] = {}
+        self.__system = self._remember(self.message(self.__dialect.system_role, system))
+
+    def message(self, role: str, text, named: bool = False) -> dict:
+        if named and self.__dialect.named_user:
+            return {"role": role, "name": self.__name, self.__dialect.text_key: text}
+        return {"role": role, self.__dialect.text_key: text}
+
+    def _remember(self, message: dict) -> dict:
+        self.__serialized[id(message)] = json.dumps(message).encode()
+        return message
+
+    def sample(self, entry: DatasetEntry) -> tuple[dict, dict]:
+        key = (entry.input_text, entry.output_text)
+        pair = self.__samples.get(key)
+        if pair is None:
+            with self.__lock:
+                pair = self.__samples.get(key)
+                if pair is None:
+                    pair = (
+                        self._remember(self.message("user", entry.input_text, named=True)),
+                        self._remember(self.message("assistant", entry.output_text)),
+                    )
+                    self.__samples[key] = pair
+        return pair
+
+    def messages(self, samples: list[DatasetEntry]) -> list[dict]:
+        messages = [self.__system]
+        for entry in samples:
+            messages.extend(self.sample(entry))
+        return messages
+
+    def serialize(self, value) -> bytes:
+        if isinstance(value, list):
+            return b"[" + b", ".join(
+                self.__serialized.get(id(item)) or self.serialize(item) for item in value
+            ) + b"]"
+        return json.dumps(value).encode()
+
+    def body(self, request_data: dict) -> bytes:
+        return b"{" + b", ".join(
+            json.dumps(key).encode() + b": " + self.serialize(value) for key, value in request_data.items()
+        ) + b"}"
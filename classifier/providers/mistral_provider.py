@@ -1,16 +1,15 @@
 from __future__ import annotations
 
-import json
-
-import tiktoken
 from openai.types.chat import ChatCompletion
 
 from . import CompletionRequest
 from . import CompletionResponse
+from .messages import MessageCompiler
 from .abstract_remote_execution_provider import (
     AbstractRemoteExecutionCompletionProvider,
 )
 from classifier.templates import zero_shot_template
+from classifier.tokens import count_prompt_tokens
 
 
 class MistralCompletionProvider(AbstractRemoteExecutionCompletionProvider):
@@ -24,21 +23,18 @@ class MistralCompletionProvider(AbstractRemoteExecutionCompletionProvider):
     def configure(self, configuration: dict) -> None:
         self.__template = configuration.get("subject", self.__template)
         AbstractRemoteExecutionCompletionProvider.configure(self, configuration)
+        if self.__template in zero_shot_template:
+            self._compiler = MessageCompiler("mistral", zero_shot_template[self.__template])
 
     def _to_request_data(self, request: CompletionRequest) -> dict:
 
         if self.__template is None:
             raise ValueError("Enable to create request: template has not specified")
-        try:
-            content = [{"role": "user", "content": zero_shot_template[self.__template]}]
-        except KeyError:
+        if self.__template not in zero_shot_template:
             raise ValueError(f"Enable to create request: \"template\" configuration parameter is invalid. Valid "
                              f"options are: {', '.join(zero_shot_template.keys())}")
 
-        for entry in request.samples:
-            content.append({"role": "user", "content": entry.input_text})
-            content.append({"role": "assistant", "content": entry.output_text})
-
+        content = self._compiler.messages(request.samples)
         return {
             "question": request.question,
             "name": "",
@@ -46,17 +42,12 @@ class MistralCompletionProvider(AbstractRemoteExecutionCompletionProvider):
             "engine": request.engine,
         }
 
-    def _estimate_cost(self, request: CompletionRequest) -> float:
+    def _estimate_prompt_tokens(self, request: CompletionRequest) -> int:
+        return count_prompt_tokens(zero_shot_template[self.__template], request)
 
-        enc = tiktoken.get_encoding("cl100k_base")
-        tokens = enc.encode(
-            json.dumps(
-                self._to_request_data(request)["request"]
-                + [{"role": "user", "content": request.question}],
-                ensure_ascii=False,
-            )
-        )
-        return self._prompt_tokens_to_price(len(tokens), request.engine)
+    def _estimate_cost(self, request: CompletionRequest) -> float:
+        tokens = self._estimate_prompt_tokens(request)
+        return self._prompt_tokens_to_price(tokens, request.engine)
 
     @staticmethod
     def _prompt_tokens_to_price(tokens: int, engine: str) -> float:
@@ -1,17 +1,19 @@
 from __future__ import annotations
+import hashlib
 import json
 from pprint import pprint
 from typing import Callable
-import tiktoken
 from openai.types.chat.chat_completion import ChatCompletion
 from . import CompletionRequest
 from . import CompletionResponse
 from ..logger import logger
+from .messages import MessageCompiler
 from .abstract_remote_execution_provider import (
     AbstractRemoteExecutionCompletionProvider,
 )
 from classifier.configuration import ConfigurationError
 from classifier.templates import zero_shot_template
+from classifier.tokens import count_prompt_tokens
 
 
 class OpenAICompletionProvider(AbstractRemoteExecutionCompletionProvider):
@@ -34,16 +36,17 @@ class OpenAICompletionProvider(AbstractRemoteExecutionCompletionProvider):
         self.__name = str(configuration.get("name"))
         if self.__name is None:
             raise ConfigurationError("name")
+        if self.__template in zero_shot_template:
+            self._compiler = MessageCompiler("openai", zero_shot_template[self.__template], name=self.__name)
 
     def _to_request_data(self, request: CompletionRequest) -> dict:
         if self.__template is None:
             raise ValueError("Enable to create request: template has not specified")
-        try:
-            content = [{"role": "system", "content": zero_shot_template[self.__template]}]
-        except KeyError:
+        if self.__template not in zero_shot_template:
             raise ValueError(f"Enable to create request: \"template\" configuration parameter is invalid. Valid "
                              f"options are: {', '.join(zero_shot_template.keys())}")
         if self.__vision:
+            content = self._compiler.messages([])
             for entry in request.samples:
                 content.append({
                     "role": "user",
@@ -64,12 +67,7 @@ class OpenAICompletionProvider(AbstractRemoteExecutionCompletionProvider):
                 "request": content,
                 "engine": request.engine,
             }
-        for entry in request.samples:
-            content.append(
-                {"role": "user", "name": self.__name, "content": entry.input_text}
-            )
-            content.append({"role": "assistant", "content": entry.output_text})
-
+        content = self._compiler.messages(request.samples)
         return {
             "question": request.question,
             "name": self.__name,
@@ -77,17 +75,21 @@ class OpenAICompletionProvider(AbstractRemoteExecutionCompletionProvider):
             "engine": request.engine,
         }        
 
-    def _estimate_cost(self, request: CompletionRequest) -> float:
-        enc = tiktoken.get_encoding("cl100k_base")
+    def _mark_prompt_cache(self, request: CompletionRequest, request_data: dict) -> dict:
+        """Route requests sharing a prefix to the same prompt cache: the few-shot block when it repeats,
+        the system prompt otherwise."""
+        prefix = [zero_shot_template[self.__template]]
+        if self._shares_prefix(request):
+            prefix += [text for entry in request.samples for text in (entry.input_text, entry.output_text)]
+        key = hashlib.sha256(json.dumps(prefix, ensure_ascii=False).encode()).hexdigest()[:32]
+        return {**request_data, "prompt_cache_key": key}
 
-        tokens = enc.encode(
-            json.dumps(
-                self._to_request_data(request)["request"]
-                + [{"role": "user", "name": self.__name, "content": request.question}],
-                ensure_ascii=False,
-            )
-        )
-        return self._prompt_tokens_to_price(len(tokens), request.engine)
+    def _estimate_prompt_tokens(self, request: CompletionRequest) -> int:
+        return count_prompt_tokens(zero_shot_template[self.__template], request)
+
+    def _estimate_cost(self, request: CompletionRequest) -> float:
+        tokens = self._estimate_prompt_tokens(request)
+        return self._prompt_tokens_to_price(tokens, request.engine)
 
     @staticmethod
     def _prompt_tokens_to_price(tokens: int, engine: str) -> float:
@@ -128,9 +130,15 @@ class OpenAICompletionProvider(AbstractRemoteExecutionCompletionProvider):
         if not model.choices[0].message.content:
             raise ValueError("Model returned an invalid response")
 
+        # Cached prompt tokens are included in prompt_tokens and billed at half the input price.
+        details = getattr(model.usage, "prompt_tokens_details", None)
+        cached = (details.get("cached_tokens") if isinstance(details, dict)
+                  else getattr(details, "cached_tokens", None)) or 0
         price = self._prompt_tokens_to_price(
-            model.usage.prompt_tokens, request.engine
-        ) + self._completion_tokens_to_price(
+            model.usage.prompt_tokens - cached, request.engine
+        ) + self._prompt_tokens_to_price(
+            cached, request.engine
+        ) * 0.5 + self._completion_tokens_to_price(
             model.usage.completion_tokens, request.engine
         )
 
@@ -139,7 +147,7 @@ class OpenAICompletionProvider(AbstractRemoteExecutionCompletionProvider):
         )
 
         logger.debug(
-            f"OpenAI reported {model.usage.prompt_tokens} prompt tokens and {model.usage.completion_tokens} "
+            f"OpenAI reported {model.usage.prompt_tokens} prompt tokens ({cached} cached) and {model.usage.completion_tokens} "
             f"completion ({price:.4f}$) tokens. Estimation was: {self._estimate_cost(request):.4f}$"
         )
 
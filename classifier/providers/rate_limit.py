@@ -0,0 +1,118 @@
+from __future__ import annotations
+
+import threading
+import time
+
+from classifier.logger import logger
+
+
+class TokenBucket:
+    """Refills ``per_minute`` units evenly over a minute; ``acquire`` blocks until enough are available."""
+
+    def __init__(self, per_minute: float):
+        self.__capacity = per_minute
+        self.__rate = per_minute / 60
+        self.__tokens = per_minute
+        self.__updated = time.monotonic()
+        self.__lock = threading.Lock()
+
+    def acquire(self, amount: float = 1) -> None:
+        amount = min(amount, self.__capacity)
+        while True:
+            with self.__lock:
+                now = time.monotonic()
+                self.__tokens = min(self.__capacity, self.__tokens + (now - self.__updated) * self.__rate)
+                self.__updated = now
+                if self.__tokens >= amount:
+                    self.__tokens -= amount
+                    return
+                delay = (amount - self.__tokens) / self.__rate
+            time.sleep(delay)
+
+
+class AdaptiveConcurrency:
+    """Limit on in-flight requests that grows additively while requests succeed
+    and shrinks multiplicatively on throttling, server errors or slow responses."""
+
+    def __init__(self, max_limit: int, target_latency: float | None = None):
+        self.__max_limit = max_limit
+        self.__limit = float(max_limit)
+        self.__target_latency = target_latency
+        self.__in_flight = 0
+        self.__condition = threading.Condition()
+
+    @property
+    def limit(self) -> int:
+        return max(1, int(self.__limit))
+
+    def acquire(self) -> None:
+        with self.__condition:
+            while self.__in_flight >= self.limit:
+                self.__condition.wait()
+            self.__in_flight += 1
+
+    def release(self, failed: bool, latency: float) -> None:
+        with self.__condition:
+            self.__in_flight -= 1
+            previous = self.limit
+            if failed:
+                self.__limit = max(1., self.__limit / 2)
+            elif self.__target_latency is not None and latency > self.__target_latency:
+                self.__limit = max(1., self.__limit * 0.9)
+            else:
+                self.__limit = min(float(self.__max_limit), self.__limit + 1 / self.__limit)
+            if self.limit != previous:
+                logger.debug(f"Concurrency limit changed from {previous} to {self.limit}")
+            self.__condition.notify_all()
+
+
+class RateLimiter:
+    """Requests-per-minute and tokens-per-minute buckets plus adaptive concurrency for one provider."""
+
+    def __init__(
+        self,
+        rpm: float | None = None,
+        tpm: float | None = None,
+        max_concurrency: int = 1,
+        target_latency: float | None = None,
+    ):
+        self.__requests = TokenBucket(rpm) if rpm else None
+        self.__tokens = TokenBucket(tpm) if tpm else None
+        self.__concurrency = AdaptiveConcurrency(max_concurrency, target_latency)
+
+    def acquire(self, tokens: int = 0) -> None:
+        if self.__requests is not None:
+            self.__requests.acquire()
+        if self.__tokens is not None and tokens:
+            self.__tokens.acquire(tokens)
+        self.__concurrency.acquire()
+
+    def release(self, status: int | None, latency: float) -> None:
+        """``status`` is the HTTP status code, or ``None`` if no response arrived."""
+        self.__concurrency.release(status is None or status == 429 or status >= 500, latency)
+
+
+_limiters: dict[str, RateLimiter] = {}
+_lock = threading.Lock()
+
+
+def get_rate_limiter(key: str, configuration: dict | None = None) -> RateLimiter:
+    """Rate limiter shared by every provider instance with the same ``key``.
+
+    Set up from the first configuration that asks for it: ``rpm_limit``,
+    ``tpm_limit``, ``max_concurrency`` (defaults to ``concurrency``) and
+    ``target_latency`` in seconds.
+    """
+    configuration = configuration or {}
+    with _lock:
+        limiter = _limiters.get(key)
+        if limiter is None:
+            target_latency = configuration.get("target_latency")
+            limiter = RateLimiter(
+                rpm=float(configuration.get("rpm_limit", 0)),
+                tpm=float(configuration.get("tpm_limit", 0)),
+                max_concurrency=int(configuration.get("max_concurrency", configuration.get("concurrency", 1))),
+                target_latency=float(target_latency) if target_latency else None,
+            )
+            _limiters[key] = limiter
+    return limiter
@@ -0,0 +1,37 @@
+from __future__ import annotations
+
+from . import CompletionProvider
+from classifier.configuration import Configuration
+from classifier.configuration import ConfigurationError
+from classifier.logger import logger
+from classifier.utils import load_class
+
+# Providers are imported only when selected: their SDKs (openai, anthropic,
+# gigachat, tiktoken) dominate start-up time.
+PROVIDERS: dict[str, str] = {
+    "openai": "classifier.providers.openai_provider:OpenAICompletionProvider",
+    "mistral": "classifier.providers.mistral_provider:MistralCompletionProvider",
+    "anthropic": "classifier.providers.anthropic_provider:AnthropicCompletionProvider",
+    "yandex": "classifier.providers.yandex_provider:YandexGPTCompletionProvider",
+    "sber": "classifier.providers.sber_provider:SberCompletionProvider",
+}
+
+
+def create_provider(configuration: dict, *extra: dict) -> CompletionProvider:
+    """Create and configure the provider named in the configuration.
+
+    The instance is meant to be created once per run and shared by every
+    request; per-item data travels in ``CompletionRequest``.
+    """
+    provider_path = PROVIDERS.get(configuration.get("provider"))
+    if provider_path is None:
+        logger.error("No provider specified.")
+        raise ConfigurationError("provider")
+
+    # Options are merged so that configure() runs once and never sees a partial configuration.
+    options = dict(configuration)
+    for item in extra:
+        options.update(item)
+    provider = load_class(provider_path)()
+    provider.configure(Configuration(options))
+    return provider
@@ -0,0 +1,106 @@
+from __future__ import annotations
+
+import random
+import threading
+import time
+from dataclasses import dataclass
+from dataclasses import field
+from email.utils import parsedate_to_datetime
+
+from classifier.logger import logger
+
+RETRYABLE_STATUS_CODES = frozenset({408, 425, 429, 500, 502, 503, 504})
+
+
+@dataclass
+class RetryPolicy:
+    """Exponential backoff with full jitter, capped by ``max_delay``; ``Retry-After`` takes precedence."""
+
+    max_attempts: int = 5
+    base_delay: float = 1.
+    max_delay: float = 60.
+    _random: random.Random = field(default_factory=random.Random, repr=False)
+
+    def configure(self, configuration: dict) -> None:
+        if configuration.get("retry_number") is not None:
+            self.max_attempts = int(configuration["retry_number"])
+        if configuration.get("retry_base_delay") is not None:
+            self.base_delay = float(configuration["retry_base_delay"])
+        if configuration.get("retry_max_delay") is not None:
+            self.max_delay = float(configuration["retry_max_delay"])
+
+    @staticmethod
+    def is_retryable(status: int) -> bool:
+        return status in RETRYABLE_STATUS_CODES
+
+    def delay(self, attempt: int, retry_after: str | None = None) -> float:
+        if retry_after:
+            try:
+                return min(self.max_delay, max(0., float(retry_after)))
+            except ValueError:
+                try:
+                    return min(self.max_delay, max(0., parsedate_to_datetime(retry_after).timestamp() - time.time()))
+                except (TypeError, ValueError):
+                    pass
+        return self._random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+
+class CircuitBreaker:
+    """Stops every worker from calling a failing endpoint.
+
+    After ``threshold`` consecutive failures the circuit opens for ``cooldown``
+    seconds, during which ``wait`` blocks. Afterwards requests are let through
+    again; a single failure re-opens the circuit until one succeeds.
+    """
+
+    def __init__(self, threshold: int = 5, cooldown: float = 30.):
+        self.__threshold = threshold
+        self.__cooldown = cooldown
+        self.__failures = 0
+        self.__open_until = 0.
+        self.__half_open = False
+        self.__lock = threading.Lock()
+
+    def wait(self) -> None:
+        while True:
+            with self.__lock:
+                delay = self.__open_until - time.monotonic()
+                if delay <= 0:
+                    return
+            time.sleep(delay)
+
+    def record_success(self) -> None:
+        with self.__lock:
+            self.__failures = 0
+            self.__half_open = False
+
+    def record_failure(self) -> None:
+        with self.__lock:
+            self.__failures += 1
+            if self.__open_until > time.monotonic():
+                return
+            if self.__half_open or self.__failures >= self.__threshold:
+                logger.warning(
+                    f"{self.__failures} consecutive failures, pausing requests for {self.__cooldown:.0f}s"
+                )
+                self.__open_until = time.monotonic() + self.__cooldown
+                self.__half_open = True
+
+
+_breakers: dict[str, CircuitBreaker] = {}
+_lock = threading.Lock()
+
+
+def get_circuit_breaker(key: str, configuration: dict | None = None) -> CircuitBreaker:
+    """Circuit breaker shared by everything calling ``key``, set up from
+    ``circuit_breaker_threshold`` and ``circuit_breaker_cooldown``."""
+    configuration = configuration or {}
+    with _lock:
+        breaker = _breakers.get(key)
+        if breaker is None:
+            breaker = CircuitBreaker(
+                threshold=int(configuration.get("circuit_breaker_threshold", 5)),
+                cooldown=float(configuration.get("circuit_breaker_cooldown", 30)),
+            )
+            _breakers[key] = breaker
+    return breaker
@@ -1,12 +1,22 @@
 import json
+import math
 import os
-import tiktoken
+import queue
+import threading
+import time
+from contextlib import contextmanager
+from typing import Iterator
 from gigachat import GigaChat
+from gigachat.exceptions import ResponseError
 from gigachat.models.chat import Chat
 from gigachat.models import ChatCompletion
 from . import CompletionProvider, CompletionRequest, CompletionResponse
 from classifier.templates import zero_shot_template
 from .abstract_remote_execution_provider import AbstractRemoteExecutionCompletionProvider
+from .messages import MessageCompiler
+from .rate_limit import get_rate_limiter
+from classifier.tokens import count_prompt_tokens
+from classifier.tokens import TokenCountingProvider
 from ..configuration import ConfigurationError
 from ..logger import logger
 
@@ -17,10 +27,72 @@ GIGACHAT_API_KEY = os.environ.get("GIGACHAT_API_KEY")
 # chat = GigaChat(credentials=GIGACHAT_API_KEY, model=models[0], verify_ssl_certs=False)
 
 
-class SberCompletionProvider(CompletionProvider):
+class GigaChatPool:
+    """Thread-safe pool of GigaChat clients of one engine sharing one OAuth token.
+
+    Clients are created on first checkout. A token that is about to expire
+    (less than ``refresh_margin`` seconds left) is dropped before the request,
+    so the client re-authenticates up front instead of failing mid-run.
+    """
+
+    def __init__(self, engine: str, size: int, refresh_margin: float = 60.):
+        self.__engine = engine
+        self.__refresh_margin = refresh_margin
+        self.__clients: queue.Queue[GigaChat | None] = queue.Queue()
+        for _ in range(max(1, size)):
+            self.__clients.put(None)
+        self.__token = None
+        self.__lock = threading.Lock()
+
+    def _is_fresh(self, token) -> bool:
+        return token is not None and token.expires_at / 1000 - time.time() > self.__refresh_margin
+
+    @contextmanager
+    def client(self) -> Iterator[GigaChat]:
+        client = self.__clients.get()
+        try:
+            if client is None:
+                client = GigaChat(credentials=GIGACHAT_API_KEY,
+                                  model=self.__engine,
+                                  verify_ssl_certs=False)
+            with self.__lock:
+                if self._is_fresh(self.__token):
+                    client._access_token = self.__token
+                elif not self._is_fresh(getattr(client, "_access_token", None)):
+                    client._access_token = None
+            yield client
+            with self.__lock:
+                token = getattr(client, "_access_token", None)
+                if self._is_fresh(token) and (self.__token is None or token.expires_at > self.__token.expires_at):
+                    self.__token = token
+        finally:
+            self.__clients.put(client)
+
+
+_pools: dict[str, GigaChatPool] = {}
+_lock = threading.Lock()
+
+
+def get_gigachat_pool(engine: str, configuration: dict) -> GigaChatPool:
+    """Client pool shared per engine, sized by ``gigachat_pool_size`` (defaults to ``concurrency``)."""
+    with _lock:
+        pool = _pools.get(engine)
+        if pool is None:
+            pool = GigaChatPool(
+                engine,
+                size=int(configuration.get("gigachat_pool_size", configuration.get("concurrency", 1))),
+                refresh_margin=float(configuration.get("gigachat_token_refresh_margin", 60)),
+            )
+            _pools[engine] = pool
+    return pool
+
+
+class SberCompletionProvider(TokenCountingProvider, CompletionProvider):
     __name: str
     __template = None
-    __chat: GigaChat = None
+    __compiler = None
+    __pool: GigaChatPool = None
+    __rate_limiter = None
 
     def __init__(self):
         if GIGACHAT_API_KEY is None:
@@ -32,44 +104,58 @@ class SberCompletionProvider(CompletionProvider):
 
     def configure(self, configuration: dict) -> None:
         self.__template = configuration.get("subject", self.__template)
+        if self.__template in zero_shot_template:
+            self.__compiler = MessageCompiler("sber", zero_shot_template[self.__template])
         self.__name = str(configuration.get("name"))
         if configuration.get("engine") is not None:
-            self.__chat = GigaChat(credentials=GIGACHAT_API_KEY,
-                                   model=configuration.get("engine"),
-                                   verify_ssl_certs=False)
+            self.__pool = get_gigachat_pool(configuration.get("engine"), configuration)
+        if self.__rate_limiter is None:
+            self.__rate_limiter = get_rate_limiter(f"sber:{configuration.get('engine')}", configuration)
         if self.__name is None:
             raise ConfigurationError("name")
 
     def get_completion(
             self, request: CompletionRequest, dry_run: bool = False
     ) -> CompletionResponse:
-        if self.__chat is None:
+        if self.__pool is None:
             raise ValueError("Engine has not been configured.")
         if dry_run:
-            return CompletionResponse(None, 0.)
-        messages = [{
-            "role": "system",
-            "content": zero_shot_template[self.__template]
-        }]
-
-        for entry in request.samples:
-            messages.append({
-                "role": "user",
-                "content": entry.input_text
-            })
-            messages.append({
-                "role": "assistant",
-                "content": entry.output_text
-            })
-
-        messages.append({
-            "role": "user",
-            "content": request.question
-        })
+            return CompletionResponse(None, math.ceil(self._estimate_cost(request) * 100) / 100)
+        messages = self.__compiler.messages(request.samples)
+        messages.append(self.__compiler.message("user", request.question))
         chat = Chat(
             messages=messages,
             stream=False,
             temperature=0.01,
         )
-        res = self.__chat.chat(chat)
-        return CompletionResponse(res.choices[0].message.content, 0)
+        self.__rate_limiter.acquire(self._estimate_prompt_tokens(request))
+        started, status = time.monotonic(), None
+        try:
+            with self.__pool.client() as client:
+                res = client.chat(chat)
+            status = 200
+        except ResponseError as e:
+            status = e.args[1] if len(e.args) > 1 else None
+            raise
+        finally:
+            self.__rate_limiter.release(status, time.monotonic() - started)
+        return CompletionResponse(
+            res.choices[0].message.content, self._tokens_to_price(res.usage.total_tokens, request.engine)
+        )
+
+    def _estimate_prompt_tokens(self, request: CompletionRequest) -> int:
+        return count_prompt_tokens(zero_shot_template[self.__template], request)
+
+    def _estimate_cost(self, request: CompletionRequest) -> float:
+        return self._tokens_to_price(self._estimate_prompt_tokens(request), request.engine)
+
+    @staticmethod
+    def _tokens_to_price(tokens: int, engine: str) -> float:
+        # GigaChat bills prompt and completion tokens alike, in ₽.
+        if engine.startswith("GigaChat-Pro"):
+            return (1.5 / 1000) * tokens
+        if engine.startswith("GigaChat-Plus"):
+            return (0.4 / 1000) * tokens
+        if engine.startswith("GigaChat"):
+            return (0.2 / 1000) * tokens
+        raise ValueError(f'Invalid engine "{engine}"')
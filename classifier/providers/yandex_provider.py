@@ -1,19 +1,128 @@
 import os
+import threading
 import time
-from pprint import pprint
-from . import CompletionProvider, CompletionRequest, CompletionResponse
+from concurrent.futures import Future
+
 import requests
+
+from . import CompletionProvider, CompletionRequest, CompletionResponse
+from .abstract_remote_execution_provider import InvalidResponseError
+from .http import get_session
+from .messages import MessageCompiler
+from .rate_limit import get_rate_limiter
+from .retry import RetryPolicy
+from classifier.logger import logger
 from classifier.templates import zero_shot_template
+from classifier.tokens import count_prompt_tokens
 
 KEY = os.environ.get("YANDEXGPT_API_KEY")
 CATALOG = os.environ.get('YC_CATALOG')
+LLM_URL = "https://llm.api.cloud.yandex.net/"
+OPERATION_URL = "https://operation.api.cloud.yandex.net/"
+HEADERS = {
+    "Authorization": f"Api-Key {KEY}",
+    "x-folder-id": CATALOG
+}
+
+
+class OperationPoller:
+    """Tracks every outstanding ``completionAsync`` operation from one background thread.
+
+    Operations are polled in rounds; each one backs off from ``min_interval``
+    to ``max_interval`` while it is still running, and its future is resolved
+    with the finished operation as soon as it is done.
+    """
+
+    def __init__(self, session, min_interval: float = 0.2, max_interval: float = 5.):
+        self.__session = session
+        self.__min_interval = min_interval
+        self.__max_interval = max_interval
+        self.__pending: dict[str, tuple[Future, float, float]] = {}
+        self.__condition = threading.Condition()
+        self.__thread: threading.Thread | None = None
+
+    def track(self, operation_id: str) -> Future:
+        future = Future()
+        with self.__condition:
+            self.__pending[operation_id] = (future, self.__min_interval, time.monotonic() + self.__min_interval)
+            if self.__thread is None:
+                self.__thread = threading.Thread(target=self._run, name="yandex-operation-poller", daemon=True)
+                self.__thread.start()
+            self.__condition.notify()
+        return future
+
+    def _run(self) -> None:
+        while True:
+            with self.__condition:
+                while not self.__pending:
+                    self.__condition.wait()
+                now = time.monotonic()
+                due = [operation_id for operation_id, (_, _, at) in self.__pending.items() if at <= now]
+                if not due:
+                    self.__condition.wait(min(at for _, _, at in self.__pending.values()) - now)
+                    continue
+
+            for operation_id in due:
+                future, interval, _ = self.__pending[operation_id]
+                try:
+                    response = self.__session.get(OPERATION_URL + f"operations/{operation_id}", headers=HEADERS)
+                    if RetryPolicy.is_retryable(response.status_code):
+                        operation = {}  # throttled or unavailable: poll again later
+                    elif not response.ok:
+                        raise requests.HTTPError(
+                            f"{response.status_code} response while polling operation {operation_id}",
+                            response=response,
+                        )
+                    else:
+                        operation = response.json()
+                except Exception as e:
+                    with self.__condition:
+                        del self.__pending[operation_id]
+                    future.set_exception(e)
+                    continue
+                with self.__condition:
+                    if operation.get("done"):
+                        del self.__pending[operation_id]
+                    else:
+                        interval = min(self.__max_interval, interval * 1.5)
+                        self.__pending[operation_id] = (future, interval, time.monotonic() + interval)
+                if operation.get("done"):
+                    future.set_result(operation)
+
+
+_pollers: dict[int, OperationPoller] = {}
+_lock = threading.Lock()
+
+
+def get_operation_poller(session, configuration: dict) -> OperationPoller:
+    with _lock:
+        poller = _pollers.get(id(session))
+        if poller is None:
+            poller = OperationPoller(
+                session,
+                min_interval=float(configuration.get("yandex_poll_interval", 0.2)),
+                max_interval=float(configuration.get("yandex_max_poll_interval", 5)),
+            )
+            _pollers[id(session)] = poller
+    return poller
 
 
 class YandexGPTCompletionProvider(CompletionProvider):
     __template = None
+    __compiler = None
+    __llm_session = None
+    __poller = None
+    __rate_limiter = None
 
     def configure(self, configuration: dict) -> None:
         self.__template = configuration.get("subject", self.__template)
+        if self.__template in zero_shot_template:
+            self.__compiler = MessageCompiler("yandex", zero_shot_template[self.__template])
+        self.__llm_session = get_session(LLM_URL, configuration)
+        if self.__poller is None:
+            self.__poller = get_operation_poller(get_session(OPERATION_URL, configuration), configuration)
+        if self.__rate_limiter is None:
+            self.__rate_limiter = get_rate_limiter(f"yandex:{configuration.get('engine')}", configuration)
 
     @property
     def provider(self):
@@ -22,25 +131,12 @@ class YandexGPTCompletionProvider(CompletionProvider):
     def get_completion(self, request: CompletionRequest, dry_run: bool = False) -> CompletionResponse:
         if dry_run:
             return CompletionResponse(None, 0.)
-        messages = [{
-            "role": "system",
-            "text": zero_shot_template[self.__template]
-        }]
-
-        for entry in request.samples:
-            messages.append({
-                "role": "user",
-                "text": entry.input_text
-            })
-            messages.append({
-                "role": "assistant",
-                "text": entry.output_text
-            })
-
-        messages.append({
-            "role": "user",
-            "text": request.question
-        })
+        return self.submit(request).result()
+
+    def submit(self, request: CompletionRequest) -> Future:
+        """Start the operation and return a future of its ``CompletionResponse``."""
+        messages = self.__compiler.messages(request.samples)
+        messages.append(self.__compiler.message("user", request.question))
 
         body = {
             "modelUri": f"gpt://{CATALOG}/{request.engine}",
@@ -51,21 +147,47 @@ class YandexGPTCompletionProvider(CompletionProvider):
             },
             "messages": messages
         }
-        headers = {
-            "Authorization": f"Api-Key {KEY}",
-            "x-folder-id": CATALOG
-        }
-        res = requests.post("https://llm.api.cloud.yandex.net/foundationModels/v1/completionAsync", json=body,
-                            headers=headers).json()
-
-        while not res["done"]:
-            res = requests.get(f"https://operation.api.cloud.yandex.net/operations/{res['id']}", headers=headers)
+        self.__rate_limiter.acquire(count_prompt_tokens(zero_shot_template[self.__template], request))
+        started, status = time.monotonic(), None
+        try:
+            res = self.__llm_session.post(LLM_URL + "foundationModels/v1/completionAsync", json=body,
+                                          headers=HEADERS)
+            status = res.status_code
+            if not res.ok:
+                raise requests.HTTPError(f"{status} response from YandexGPT", response=res)
             res = res.json()
-            time.sleep(0.2)
-        if not res.get("response", None):
-            pprint(res)
-            input()
-        res = res["response"]
-
-        return CompletionResponse(res["alternatives"][0]["message"]["text"].lower(), (
-                    int(res["usage"]["inputTextTokens"]) + int(res["usage"]["completionTokens"])) * 1.2 / 1000)
+            if res.get("done"):
+                operation = Future()
+                operation.set_result(res)
+            elif "id" in res:
+                operation = self.__poller.track(res["id"])
+            else:
+                raise InvalidResponseError(f"YandexGPT returned no operation id: {res}")
+        except Exception:
+            self.__rate_limiter.release(status, time.monotonic() - started)
+            raise
+
+        completion = Future()
+
+        def resolve(finished: Future) -> None:
+            self.__rate_limiter.release(status, time.monotonic() - started)
+            try:
+                completion.set_result(self._from_operation(finished.result()))
+            except Exception as e:
+                completion.set_exception(e)
+
+        operation.add_done_callback(resolve)
+        return completion
+
+    @staticmethod
+    def _from_operation(operation: dict) -> CompletionResponse:
+        if not operation.get("response", None):
+            logger.error(f"YandexGPT operation failed: {operation}")
+            raise InvalidResponseError(f"YandexGPT operation {operation.get('id')} returned no response")
+        res = operation["response"]
+
+        try:
+            return CompletionResponse(res["alternatives"][0]["message"]["text"].lower(), (
+                        int(res["usage"]["inputTextTokens"]) + int(res["usage"]["completionTokens"])) * 1.2 / 1000)
+        except (KeyError, IndexError, TypeError, ValueError) as e:
+            raise InvalidResponseError(f"Invalid YandexGPT response: {e}") from e
@@ -0,0 +1,107 @@
+from __future__ import annotations
+
+import json
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Sequence
+
+from classifier.dataset import DatasetEntry
+from classifier.logger import logger
+
+
+class ResultsWriter:
+    """Appends every result to a JSONL file as soon as it arrives.
+
+    Lines are flushed immediately and fsync'ed every ``fsync_every`` records
+    or ``fsync_interval`` seconds, whichever comes first, and on close.
+    """
+
+    def __init__(self, path: Path, fsync_every: int = 16, fsync_interval: float = 5.0):
+        _truncate_torn_line(path)
+        self.__file = open(path, "a", encoding="utf-8")
+        self.__fsync_every = fsync_every
+        self.__fsync_interval = fsync_interval
+        self.__pending = 0
+        self.__synced_at = time.monotonic()
+        self.__lock = threading.Lock()
+
+    def write(self, record: dict) -> None:
+        with self.__lock:
+            self.__file.write(json.dumps(record, ensure_ascii=False) + "\n")
+            self.__file.flush()
+            self.__pending += 1
+            if (
+                self.__pending >= self.__fsync_every
+                or time.monotonic() - self.__synced_at >= self.__fsync_interval
+            ):
+                self._sync()
+
+    def _sync(self) -> None:
+        os.fsync(self.__file.fileno())
+        self.__pending = 0
+        self.__synced_at = time.monotonic()
+
+    def close(self) -> None:
+        with self.__lock:
+            if not self.__file.closed:
+                self.__file.flush()
+                self._sync()
+                self.__file.close()
+
+    def __enter__(self) -> ResultsWriter:
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+
+def _truncate_torn_line(path: Path) -> None:
+    """Drop a last line left unfinished by a crash, so the next record starts on a line of its own."""
+    if not path.is_file():
+        return
+    with open(path, "r+b") as file:
+        end = file.seek(0, os.SEEK_END)
+        position = end
+        while position > 0:
+            start = max(0, position - 4096)
+            file.seek(start)
+            chunk = file.read(position - start)
+            newline = chunk.rfind(b"\n")
+            if newline != -1:
+                position = start + newline + 1
+                break
+            position = start
+        if position != end:
+            logger.warning(f"Dropping an unfinished last line of {path}")
+            file.truncate(position)
+
+
+def read_results(path: Path) -> list[dict]:
+    """Records written by ``ResultsWriter``; a line cut short by a crash is skipped."""
+    if not path.is_file():
+        return []
+    records = []
+    with open(path, encoding="utf-8") as file:
+        for n, line in enumerate(file, start=1):
+            try:
+                records.append(json.loads(line))
+            except json.JSONDecodeError:
+                logger.warning(f"Skipping malformed line {n} of {path}")
+    return records
+
+
+def read_answers(path: Path, test: Sequence[DatasetEntry]) -> tuple[dict[int, dict], int]:
+    """Latest result of every test item, by index, and the number of records that were dropped
+    because their input is no longer the test item at that index."""
+    answered: dict[int, dict] = {}
+    stale = 0
+    for record in read_results(path):
+        index = record.pop("index")
+        if index < len(test) and record.get("input") == test[index].input_text:
+            answered[index] = record
+        else:
+            answered.pop(index, None)
+            stale += 1
+    return answered, stale
@@ -1,12 +1,25 @@
 import os
+import threading
+from concurrent.futures import Future
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from uuid import uuid4
 import requests
 import magic
 import boto3
+from botocore.exceptions import ClientError
+
+from classifier.logger import logger
+from classifier.utils import file_digest
 
 class S3Storage:
-    def __init__(self):
+    """Uploads files under the sha256 of their content, so every distinct file is uploaded once.
+
+    Uploaded URLs are remembered in ``manifest_path`` across runs; other objects
+    are checked with ``head_object`` before uploading. Uploads run on a pool of
+    ``workers`` threads.
+    """
+
+    def __init__(self, manifest_path: Path | None = None, workers: int = 8):
         self.s3 = boto3.client(
             's3',
             aws_access_key_id=os.environ.get("S3_ACCESS_KEY"),
@@ -14,13 +27,45 @@ class S3Storage:
             endpoint_url=os.environ.get("S3_ENDPOINT_URL")
         )
         self.bucket = os.environ.get("S3_BUCKET")
+        self.__manifest_path = manifest_path
+        self.__uploaded: set[str] = set()
+        if manifest_path is not None and manifest_path.is_file():
+            self.__uploaded = set(manifest_path.read_text().split())
+        self.__futures: dict[str, Future] = {}
+        self.__lock = threading.Lock()
+        self.__executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="s3-upload")
+
     def store(self, filepath: str) -> str:
+        return self.store_async(filepath).result()
+
+    def store_async(self, filepath: str) -> Future:
+        """Start uploading ``filepath`` unless it is already stored; the future resolves to its URL."""
         filepath = Path(filepath)
-        uuid = uuid4()
-        res_filename = os.environ.get("S3_ENDPOINT_URL") + "/" + self.bucket + "/" + str(uuid) + filepath.suffix
-        # requests.put(res_filename, filepath.open("rb"), headers={
-        #     "Content-Type": magic.from_file(str(filepath)),
-        #     "Authorization": self.__s3_access_key
-        # })
-        self.s3.upload_file(filepath, self.bucket, str(uuid) + filepath.suffix)
+        key = file_digest(filepath) + filepath.suffix
+        with self.__lock:
+            future = self.__futures.get(key)
+            if future is None or (future.done() and future.exception() is not None):
+                future = self.__executor.submit(self._upload, filepath, key)
+                self.__futures[key] = future
+        return future
+
+    def _upload(self, filepath: Path, key: str) -> str:
+        res_filename = os.environ.get("S3_ENDPOINT_URL") + "/" + self.bucket + "/" + key
+        if res_filename in self.__uploaded:
+            return res_filename
+        try:
+            self.s3.head_object(Bucket=self.bucket, Key=key)
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") not in ("404", "NoSuchKey", "NotFound"):
+                raise
+            self.s3.upload_file(filepath, self.bucket, key)
+            logger.debug(f"Uploaded {filepath} to {res_filename}")
+        self._remember(res_filename)
         return res_filename
+
+    def _remember(self, url: str) -> None:
+        with self.__lock:
+            self.__uploaded.add(url)
+            if self.__manifest_path is not None:
+                with open(self.__manifest_path, "a") as file:
+                    file.write(url + "\n")
@@ -1,11 +1,29 @@
 from __future__ import annotations
 
+import random
 from abc import ABC
 from abc import abstractmethod
+from typing import Sequence
 
 from classifier.dataset import DatasetEntry
 
 
+def choices_excluding(n: int, excluded: list[int], k: int) -> list[int]:
+    """``random.choices`` over ``range(n)`` without the ``excluded`` positions.
+
+    Draws exactly what ``random.choices`` would draw from a copy of the
+    population with those positions popped, without building that copy.
+    """
+    excluded = sorted(excluded)
+    indices = []
+    for position in random.choices(range(n - len(excluded)), k=k):
+        for skipped in excluded:
+            if position >= skipped:
+                position += 1
+        indices.append(position)
+    return indices
+
+
 class Sampler(ABC):
     name: str = "undefined"
 
@@ -14,7 +32,13 @@ class Sampler(ABC):
         pass
 
     @abstractmethod
+    def sample_indices(
+        self, train: Sequence[DatasetEntry], test: Sequence[DatasetEntry]
+    ) -> list[int]:
+        """Positions of the chosen examples in ``train``, which is never copied or modified."""
+        pass
+
     def sample(
-        self, train: list[DatasetEntry], test: list[DatasetEntry]
+        self, train: Sequence[DatasetEntry], test: Sequence[DatasetEntry]
     ) -> list[DatasetEntry]:
-        pass
+        return [train[i] for i in self.sample_indices(train, test)]
@@ -1,8 +1,9 @@
 from __future__ import annotations
 
-import copy
 import random
+from typing import Sequence
 
+from . import choices_excluding
 from . import Sampler
 from classifier.dataset import DatasetEntry
 
@@ -13,7 +14,7 @@ class EqualSampler(Sampler):
     __classes = None
     __max_length = 5
     __seed = None
-    __chosen_entries = None
+    __chosen_indices = None
 
     def configure(self, config: dict):
 
@@ -22,30 +23,24 @@ class EqualSampler(Sampler):
         self.__max_length = config.get("n_for_train", self.__max_length)
         self.__seed = config.get("seed", self.__seed)
 
-    def sample(
-        self, train: list[DatasetEntry], test: list[DatasetEntry]
-    ) -> list[DatasetEntry]:
+    def sample_indices(
+        self, train: Sequence[DatasetEntry], test: Sequence[DatasetEntry]
+    ) -> list[int]:
 
-        if self.__chosen_entries is not None:
-            return self.__chosen_entries
-        train = copy.deepcopy(train)
+        if self.__chosen_indices is not None:
+            return self.__chosen_indices
         items = []
 
-        for i, entry in enumerate(train):
-            if not items:
-                items.append(entry)
-                train.pop(i)
-            else:
-                if items[0].classes != entry.classes:
-                    items.append(entry)
-                    train.pop(i)
-                    break
-            # if i + 1 == len(train):
-            #     raise ValueError(
-            #         f"Impossible to generate dataset: class {self.__predict} doesn't exist in train dataset"
-            #     )
+        # The first entry, then the first one of another class. The entry right
+        # after the first is never considered, as in the original list-popping loop.
+        if len(train):
+            items.append(0)
+        for i in range(2, len(train)):
+            if train[0].classes != train[i].classes:
+                items.append(i)
+                break
 
         random.seed(self.__seed)
-        items += list(random.choices(train, k=(self.__max_length - 2)))
-        self.__chosen_entries = items
+        items += choices_excluding(len(train), items, k=(self.__max_length - 2))
+        self.__chosen_indices = items
         return items
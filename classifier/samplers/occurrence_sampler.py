@@ -1,8 +1,8 @@
 from __future__ import annotations
 
-import copy
-import random
+from typing import Sequence
 
+from . import choices_excluding
 from . import Sampler
 from classifier.dataset import DatasetEntry
 
@@ -19,22 +19,20 @@ class OccurrenceSampler(Sampler):
         self.__classes = config.get("classes", self.__classes)
         self.__max_length = config.get("n_for_train", self.__max_length)
 
-    def sample(
-        self, train: list[DatasetEntry], test: list[DatasetEntry]
-    ) -> list[DatasetEntry]:
+    def sample_indices(
+        self, train: Sequence[DatasetEntry], test: Sequence[DatasetEntry]
+    ) -> list[int]:
 
-        train = copy.deepcopy(train)
         items = []
 
         for i, entry in enumerate(train):
             if self.__predict in entry.classes:
-                items.append(entry)
-                train.pop(i)
+                items.append(i)
                 break
             if i + 1 == len(train):
                 raise ValueError(
                     f"Impossible to generate dataset: class {self.__predict} doesn't exist in train dataset"
                 )
 
-        items += list(random.choices(train, k=(self.__max_length - 1)))
+        items += choices_excluding(len(train), items, k=(self.__max_length - 1))
         return items
@@ -0,0 +1,26 @@
+from __future__ import annotations
+
+from . import Sampler
+from classifier.configuration import ConfigurationError
+from classifier.logger import logger
+from classifier.utils import load_class
+
+# Imported lazily, so that only the tanimoto sampler pulls in rdkit (numpy comes with pandas anyway).
+SAMPLERS: dict[str, str] = {
+    "strict": "classifier.samplers.strict_sampler:StrictSampler",
+    "occurrence": "classifier.samplers.occurrence_sampler:OccurrenceSampler",
+    "tanimoto": "classifier.samplers.tanimoto_sampler:TanimotoSampler",
+    "equal": "classifier.samplers.equal_sampler:EqualSampler",
+    "simple": "classifier.samplers.simple_sampler:SimpleSampler",
+}
+
+
+def create_sampler(configuration: dict) -> Sampler:
+    sampler_path = SAMPLERS.get(configuration.get("sampler"))
+    if sampler_path is None:
+        logger.error("No sampler specified.")
+        raise ConfigurationError("sampler")
+
+    sampler = load_class(sampler_path)()
+    sampler.configure(configuration)
+    return sampler
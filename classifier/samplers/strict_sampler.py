@@ -1,7 +1,7 @@
 from __future__ import annotations
 
-import copy
 import random
+from typing import Sequence
 
 from . import Sampler
 from classifier.dataset import DatasetEntry
@@ -19,20 +19,21 @@ class StrictSampler(Sampler):
         self.__predict = config.get("class", self.__predict)
         self.__seed = config.get("seed", self.__seed)
 
-    def sample(
+    def sample_indices(
         self,
-        train: list[DatasetEntry],
-        test: list[DatasetEntry],
-    ) -> list[DatasetEntry]:
+        train: Sequence[DatasetEntry],
+        test: Sequence[DatasetEntry],
+    ) -> list[int]:
 
         items = []
-        train = copy.deepcopy(train)
+        # Shuffling positions draws the same permutation as shuffling the entries.
+        order = list(range(len(train)))
         random.seed(self.__seed)
-        random.shuffle(train)
+        random.shuffle(order)
 
-        for entry in train:
-            if self.__predict in entry.classes:
-                items.append(entry)
+        for i in order:
+            if self.__predict in train[i].classes:
+                items.append(i)
             if len(items) >= self.__max_length:
                 break
 
@@ -1,16 +1,13 @@
 from __future__ import annotations
 
-import copy
-import random
-# from drfp import DrfpEncoder
-import numpy as np
-
-from rdkit.Chem import rdChemReactions
-from rdkit import DataStructs
-from rdkit.DataStructs.cDataStructs import ConvertToNumpyArray
+from typing import Sequence
 
 from . import Sampler
+from classifier.configuration import as_bool
 from classifier.dataset import DatasetEntry
+from classifier.fingerprints import ReactionFingerprintIndex
+from classifier.fingerprints import ReactionFingerprintStore
+from classifier.utils import cache_directory
 
 
 class TanimotoSampler(Sampler):
@@ -20,6 +17,11 @@ class TanimotoSampler(Sampler):
     __seed = None
     __max_length = 5
     __request = None
+    __index: ReactionFingerprintIndex | None = None
+    __indexed_train = None
+    __store: ReactionFingerprintStore | None = None
+    __workers = 1
+    __chunk_size = 2048
 
     def configure(self, config: dict):
         self.__predict = config.get("class", self.__predict)
@@ -27,34 +29,29 @@ class TanimotoSampler(Sampler):
         self.__max_length = config.get("n_for_train", self.__max_length)
         self.__request = config.get("request", self.__request)
         self.__seed = config.get("seed", self.__seed)
-
-    def sample(
+        self.__workers = int(config.get("featurize_workers", self.__workers))
+        self.__chunk_size = int(config.get("featurize_chunk_size", self.__chunk_size))
+        if config.get("dataset") is not None and as_bool(config.get("fingerprint_cache", True)):
+            self.__store = ReactionFingerprintStore(
+                cache_directory(config, "fingerprints"),
+                config.get("dataset"),
+                self.__workers,
+                self.__chunk_size,
+            )
+
+    def _get_index(self, train: Sequence[DatasetEntry]) -> ReactionFingerprintIndex:
+        if self.__index is None or self.__indexed_train is not train:
+            if self.__store is not None:
+                self.__index = self.__store.index(train)
+            else:
+                self.__index = ReactionFingerprintIndex.build(train, self.__workers, self.__chunk_size)
+            self.__indexed_train = train
+        return self.__index
+
+    def sample_indices(
             self,
-            train: list[DatasetEntry],
-            test: list[DatasetEntry],
-    ) -> list[DatasetEntry]:
-
-        train = copy.deepcopy(train)
-        # random.seed(self.__seed)
-        # random.shuffle(train)
-
-        items = []
-
-        request_rxn = rdChemReactions.ReactionFromSmarts(self.__request)
-        request_fp = rdChemReactions.CreateStructuralFingerprintForReaction(request_rxn)
-
-        similarities = []
-        for i, entry in enumerate(train):
-            if entry.features[0].lstrip('reaction: ') == self.__request:
-                continue
-            rxn = rdChemReactions.ReactionFromSmarts(entry.features[0].lstrip('reaction: '))
-            example_fp = rdChemReactions.CreateStructuralFingerprintForReaction(rxn)
-            tanimoto_similarity = DataStructs.TanimotoSimilarity(request_fp, example_fp)
-            similarities.append((i, tanimoto_similarity))
-        similarities.sort(key=lambda x: x[1], reverse=True)
-        for sim in similarities:
-            items.append(train[sim[0]])
-            if len(items) >= self.__max_length:
-                break
-
-        return items
+            train: Sequence[DatasetEntry],
+            test: Sequence[DatasetEntry],
+    ) -> list[int]:
+
+        return self._get_index(train).top_k(self.__request, self.__max_length)
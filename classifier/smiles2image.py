@@ -1,14 +1,53 @@
+import hashlib
 import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
+from typing import Iterable
 
+import rdkit
 from rdkit.Chem import AllChem
 from rdkit.Chem import Draw
-from slugify import slugify
 import PIL.Image
 
+from classifier.logger import logger
+
+
+def _render(content: str, path: Path, width: int, height: int) -> None:
+    d2d = Draw.MolDraw2DCairo(width, height)
+    r = AllChem.ReactionFromSmarts(content, useSmiles=True)
+    d2d.DrawReaction(r)
+    img = d2d.GetDrawingText()
+    tmp_path = path.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+    tmp_path.write_bytes(img)
+    os.replace(tmp_path, path)
+
+
+def _render_chunk(chunk: list[tuple[str, Path]], width: int, height: int) -> list[tuple[str, str]]:
+    failed = []
+    for content, path in chunk:
+        try:
+            _render(content, path, width, height)
+        except Exception as e:
+            failed.append((content, repr(e)))
+    return failed
+
+
 class Smiles2ImageConverter:
-    def __init__(self, save_path: Path):
-        self.__save_path = save_path
+    """Renders reactions to PNG files named by a hash of the SMILES and the image size.
+
+    Images already present in ``save_path`` (or ``S2I_CACHE_DIR``) are reused
+    across runs; recently used paths are also kept in an in-memory LRU.
+    """
+
+    def __init__(self, save_path: Path, memory_size: int = 4096):
+        self.__save_path = Path(os.environ.get("S2I_CACHE_DIR") or save_path)
+        self.__save_path.mkdir(parents=True, exist_ok=True)
+        self.__memory_size = memory_size
+        self.__paths: OrderedDict[str, Path] = OrderedDict()
+        self.__lock = threading.Lock()
         img_size = os.environ.get("S2I_IMAGE_SIZE")
         if img_size is None:
             raise ValueError("--experimental-s2i requires S2I_IMAGE_SIZE to be set.")
@@ -18,11 +57,60 @@ class Smiles2ImageConverter:
         except ValueError:
             raise ValueError(f"S2I_IMAGE_SIZE={img_size} is not a valid integer")
 
+    def key(self, content: str) -> str:
+        return hashlib.sha256(
+            f"{rdkit.__version__}:{self.__img_w}x{self.__img_h}:{content}".encode()
+        ).hexdigest()
+
+    def path(self, content: str) -> Path:
+        return self.__save_path / (self.key(content) + ".png")
+
     def convert(self, content: str):
-        d2d = Draw.MolDraw2DCairo(self.__img_w, self.__img_h)
-        r = AllChem.ReactionFromSmarts(content, useSmiles=True)
-        d2d.DrawReaction(r)
-        img = d2d.GetDrawingText()
-        path = self.__save_path / (slugify(content) + ".png")
-        open(path, "wb").write(img)
+        key = self.key(content)
+        with self.__lock:
+            path = self.__paths.get(key)
+            if path is not None:
+                self.__paths.move_to_end(key)
+                return path
+
+        path = self.__save_path / (key + ".png")
+        if not path.is_file():
+            _render(content, path, self.__img_w, self.__img_h)
+        self._remember(key, path)
         return path
+
+    def _remember(self, key: str, path: Path) -> None:
+        with self.__lock:
+            self.__paths[key] = path
+            self.__paths.move_to_end(key)
+            if len(self.__paths) > self.__memory_size:
+                self.__paths.popitem(last=False)
+
+    def prerender(self, contents: Iterable[str], workers: int = 1, chunk_size: int = 64) -> list[str]:
+        """Render every reaction not yet on disk across ``workers`` processes; returns the failed ones."""
+        missing = [(content, self.path(content)) for content in dict.fromkeys(contents)]
+        missing = [(content, path) for content, path in missing if not path.is_file()]
+        if not missing:
+            return []
+
+        started = time.monotonic()
+        chunks = [missing[start:start + chunk_size] for start in range(0, len(missing), chunk_size)]
+        if workers > 1 and len(chunks) > 1:
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                results = list(executor.map(
+                    _render_chunk, chunks, [self.__img_w] * len(chunks), [self.__img_h] * len(chunks)
+                ))
+        else:
+            results = [_render_chunk(chunk, self.__img_w, self.__img_h) for chunk in chunks]
+        failed = [item for chunk_failed in results for item in chunk_failed]
+
+        elapsed = time.monotonic() - started
+        logger.info(
+            f"Rendered {len(missing) - len(failed)} reaction images in {elapsed:.1f}s "
+            f"({(len(missing) - len(failed)) / max(elapsed, 1e-9):.1f} images/s, {workers} workers)"
+        )
+        if failed:
+            logger.warning(
+                f"Failed to render {len(failed)} of {len(missing)} reactions. First ones: {failed[:5]}"
+            )
+        return [content for content, _ in failed]
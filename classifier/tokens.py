@@ -0,0 +1,69 @@
+from __future__ import annotations
+
+import os
+from functools import lru_cache
+from typing import Iterable
+
+import tiktoken
+
+from classifier.providers import CompletionRequest
+
+MESSAGE_OVERHEAD = 4  # role and delimiters of one chat message
+
+
+@lru_cache(maxsize=None)
+def get_encoding(name: str) -> tiktoken.Encoding:
+    return tiktoken.get_encoding(name)
+
+
+class TokenCounter:
+    """Memoized token counts of texts for one encoding.
+
+    Templates and dataset entries repeat across requests, so each distinct
+    text is encoded once and a request is priced by summing its messages.
+    """
+
+    def __init__(self, encoding: str):
+        self.__encoding = get_encoding(encoding)
+        self.__counts: dict[str, int] = {}
+
+    def count(self, text: str) -> int:
+        count = self.__counts.get(text)
+        if count is None:
+            count = len(self.__encoding.encode(text, disallowed_special=()))
+            self.__counts[text] = count
+        return count
+
+    def count_messages(self, texts: Iterable[str]) -> int:
+        return sum(self.count(text) + MESSAGE_OVERHEAD for text in texts)
+
+    def warm(self, texts: Iterable[str], num_threads: int | None = None) -> None:
+        """Encode all unseen texts at once with ``encode_batch`` across threads."""
+        missing = [text for text in dict.fromkeys(texts) if text not in self.__counts]
+        if not missing:
+            return
+        encoded = self.__encoding.encode_batch(
+            missing, num_threads=num_threads or os.cpu_count() or 1, disallowed_special=()
+        )
+        self.__counts.update(zip(missing, map(len, encoded)))
+
+
+@lru_cache(maxsize=None)
+def get_token_counter(encoding: str = "cl100k_base") -> TokenCounter:
+    return TokenCounter(encoding)
+
+
+class TokenCountingProvider:
+    """Mixin for providers that price requests with the shared ``cl100k_base`` counter."""
+
+    def warm_up(self, texts: Iterable[str]) -> None:
+        get_token_counter().warm(texts)
+
+
+def count_prompt_tokens(system: str, request: CompletionRequest, encoding: str = "cl100k_base") -> int:
+    texts = [system]
+    for entry in request.samples:
+        texts.append(entry.input_text)
+        texts.append(entry.output_text)
+    texts.append(request.question)
+    return get_token_counter(encoding).count_messages(texts)
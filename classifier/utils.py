@@ -1,5 +1,7 @@
 from __future__ import annotations
 
+import hashlib
+from importlib import import_module
 from pathlib import Path
 
 
@@ -14,3 +16,26 @@ def create_result_directory(config: dict) -> Path:
     result_directory.mkdir(parents=True)
 
     return result_directory
+
+
+def file_digest(path: Path) -> str:
+
+    digest = hashlib.sha256()
+    with open(path, "rb") as file:
+        for chunk in iter(lambda: file.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def cache_directory(config: dict, name: str) -> Path:
+
+    directory = Path(config.get("cache_dir") or "./.cache") / name
+    directory.mkdir(parents=True, exist_ok=True)
+    return directory
+
+
+def load_class(path: str) -> type:
+    """Import ``"package.module:ClassName"`` on demand."""
+
+    module_name, class_name = path.split(":")
+    return getattr(import_module(module_name), class_name)
@@ -0,0 +1,33 @@
+import pytest
+
+from classifier.configuration import Configuration
+from classifier.providers.registry import create_provider
+from classifier.templates import zero_shot_template
+
+
+@pytest.fixture
+def provider_options() -> dict:
+    """Overrides of the base provider configuration; override or parametrize it per test."""
+    return {}
+
+
+@pytest.fixture
+def provider_configuration(provider_options) -> Configuration:
+    return Configuration({
+        "provider": "openai",
+        "name": "tester",
+        "api_url": "localhost:1",
+        "subject": next(iter(zero_shot_template)),
+        "engine": "gpt-4",
+        "retry_base_delay": "0",
+        **provider_options,
+    })
+
+
+@pytest.fixture
+def provider(provider_configuration):
+    provider = create_provider(provider_configuration)
+    # tiktoken downloads its encodings; token counts do not matter here.
+    provider._estimate_prompt_tokens = lambda request: 10
+    provider._estimate_cost = lambda request: 0.
+    return provider
@@ -0,0 +1,103 @@
+"""Local stand-in for the API proxy: ``GET respond`` and the ``POST batch`` / ``GET batch/<id>`` job protocol.
+
+Every completion echoes the request's question, so callers can check which
+answer came back for which request.
+"""
+from __future__ import annotations
+
+import itertools
+import json
+import threading
+from http.server import BaseHTTPRequestHandler
+from http.server import ThreadingHTTPServer
+
+
+def completion(text: str) -> dict:
+    return {
+        "id": "chatcmpl-stand-in",
+        "object": "chat.completion",
+        "created": 0,
+        "model": "stand-in",
+        "choices": [{
+            "index": 0,
+            "finish_reason": "stop",
+            "message": {"role": "assistant", "content": text},
+        }],
+        "usage": {"prompt_tokens": 10, "completion_tokens": 2, "total_tokens": 12},
+    }
+
+
+class StandInProxy:
+    """Runs the stand-in on a free local port for the duration of a ``with`` block.
+
+    ``polls`` is how many status checks a batch job stays ``in_progress``;
+    statuses queued in ``failures`` are answered, one per call, before any real
+    handling; custom ids in ``failing_ids`` get an error entry instead of a response.
+    """
+
+    def __init__(self, polls: int = 2):
+        self.polls = polls
+        self.failures: list[int] = []
+        self.failing_ids: set[str] = set()
+        self.jobs: dict[str, dict] = {}
+        self.submitted = 0
+        self.__ids = itertools.count(1)
+        self.__lock = threading.Lock()
+        self.__server = ThreadingHTTPServer(("127.0.0.1", 0), self._handler())
+        self.url = f"http://127.0.0.1:{self.__server.server_address[1]}/"
+
+    def __enter__(self) -> StandInProxy:
+        threading.Thread(target=self.__server.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.__server.shutdown()
+        self.__server.server_close()
+
+    def handle(self, method: str, path: str, body: bytes) -> tuple[int, dict]:
+        with self.__lock:
+            if self.failures:
+                return self.failures.pop(0), {"error": "injected failure"}
+            if method == "GET" and path == "/respond":
+                return 200, completion(json.loads(body)["question"])
+            if method == "POST" and path == "/batch":
+                self.submitted += 1
+                job_id = f"batch-{next(self.__ids)}"
+                self.jobs[job_id] = {"requests": json.loads(body)["requests"], "polls": self.polls}
+                return 200, {"id": job_id, "status": "in_progress"}
+            if method == "GET" and path.startswith("/batch/"):
+                job_id = path.removeprefix("/batch/")
+                job = self.jobs.get(job_id)
+                if job is None:
+                    return 404, {"error": f"unknown batch {job_id}"}
+                if job["polls"] > 0:
+                    job["polls"] -= 1
+                    return 200, {"id": job_id, "status": "in_progress"}
+                return 200, {"id": job_id, "status": "completed", "results": [
+                    {"custom_id": item["custom_id"], "error": "stand-in failure"}
+                    if item["custom_id"] in self.failing_ids else
+                    {"custom_id": item["custom_id"], "response": completion(item["request"]["question"])}
+                    for item in job["requests"]
+                ]}
+            return 404, {"error": f"no route {method} {path}"}
+
+    def _handler(self) -> type[BaseHTTPRequestHandler]:
+        proxy = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def _reply(self) -> None:
+                body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+                status, payload = proxy.handle(self.command, self.path, body)
+                data = json.dumps(payload).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            do_GET = do_POST = _reply
+
+            def log_message(self, *args) -> None:
+                pass
+
+        return Handler
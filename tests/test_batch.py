@@ -0,0 +1,65 @@
+import pytest
+
+from classifier.dataset import DatasetEntry
+from classifier.providers import CompletionRequest
+from classifier.providers.abstract_remote_execution_provider import BatchError
+from tests.proxy import StandInProxy
+
+
+@pytest.fixture
+def proxy():
+    with StandInProxy() as proxy:
+        yield proxy
+
+
+@pytest.fixture
+def provider_options(proxy):
+    return {"api_url": proxy.url, "batch_poll_interval": "0", "http_keep_alive": "false"}
+
+
+def requests_for(*indices: int) -> dict[str, CompletionRequest]:
+    return {
+        str(index): CompletionRequest([DatasetEntry("a", "b")], f"question {index}", "gpt-4")
+        for index in indices
+    }
+
+
+def test_batch_round_trips_custom_ids(provider, proxy):
+    outcomes = provider.get_completions_batch(requests_for(7, 3, 11))
+    assert {custom_id: outcome.text for custom_id, outcome in outcomes.items()} == {
+        "7": "question 7", "3": "question 3", "11": "question 11",
+    }
+    assert proxy.submitted == 1
+
+
+def test_batch_survives_transient_poll_failure(provider, proxy):
+    submitted = []
+    proxy.polls = 1
+
+    def fail_next_poll(job_id):
+        submitted.append(job_id)
+        proxy.failures.append(502)
+
+    outcomes = provider.get_completions_batch(requests_for(1, 2), on_submit=fail_next_poll)
+    assert [outcome.text for outcome in outcomes.values()] == ["question 1", "question 2"]
+    assert len(submitted) == 1
+
+
+def test_batch_is_picked_up_by_job_id(provider, proxy):
+    submitted = []
+    provider.get_completions_batch(requests_for(1, 2), on_submit=submitted.append)
+
+    outcomes = provider.get_completions_batch(requests_for(1, 2), job_id=submitted[0])
+    assert outcomes["2"].text == "question 2"
+    assert proxy.submitted == 1
+
+
+def test_failed_batch_item_is_reported(provider, proxy):
+    proxy.failing_ids.add("2")
+    outcomes = provider.get_completions_batch(requests_for(1, 2))
+    assert outcomes["1"].text == "question 1"
+    assert isinstance(outcomes["2"], BatchError)
+
+
+def test_respond_through_stand_in(provider):
+    assert provider.get_completion(requests_for(5)["5"]).text == "question 5"
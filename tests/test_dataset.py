@@ -0,0 +1,16 @@
+import pytest
+
+from benchmarks.bench_dataset_loading import config_for
+from benchmarks.bench_dataset_loading import make_frame
+from benchmarks.bench_dataset_loading import process_entries_rowwise
+from classifier.dataset import Dataset
+
+
+@pytest.mark.parametrize("pure_text", [False, True])
+def test_vectorized_entries_match_rowwise(pure_text):
+    frame, config = make_frame(500, pure_text), config_for(pure_text)
+    vectorized = Dataset._process_entries(frame, config)
+    reference = process_entries_rowwise(frame, config)
+    assert [(entry.input_text, entry.output_text, entry.split) for entry in vectorized] == \
+        [(entry.input_text, entry.output_text, entry.split) for entry in reference]
+    assert vectorized.has_predefined_split
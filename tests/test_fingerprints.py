@@ -0,0 +1,64 @@
+import numpy as np
+import pytest
+
+pytest.importorskip("rdkit")
+
+from classifier.dataset import DatasetEntry
+from classifier.fingerprints import featurize
+from classifier.fingerprints import popcount
+from classifier.fingerprints import ReactionFingerprintIndex
+from classifier.fingerprints import ReactionFingerprintStore
+
+REACTIONS = ["CCO>>CC=O", "CC(=O)O.OCC>>CC(=O)OCC", "Brc1ccccc1>>Oc1ccccc1", "C=CC>>CCC"]
+
+
+def entries(reactions):
+    return [DatasetEntry(f"reaction: {reaction}", "high_yielding") for reaction in reactions]
+
+
+def test_store_matches_fresh_index(tmp_path):
+    dataset = tmp_path / "dataset.csv"
+    dataset.write_text("reactions")
+    train = entries(REACTIONS)
+    store = ReactionFingerprintStore(tmp_path / "store", dataset)
+    (tmp_path / "store").mkdir()
+
+    stored = store.index(train)
+    fresh = ReactionFingerprintIndex.build(train)
+    assert stored.top_k(REACTIONS[0], 2) == fresh.top_k(REACTIONS[0], 2)
+
+
+def test_store_keeps_one_version(tmp_path):
+    dataset = tmp_path / "dataset.csv"
+    dataset.write_text("reactions")
+    directory = tmp_path / "store"
+    directory.mkdir()
+    store = ReactionFingerprintStore(directory, dataset)
+
+    store.index(entries(REACTIONS[:2]))
+    store.index(entries(REACTIONS[1:3]))
+    index = store.index(entries(REACTIONS))
+
+    assert len(list(directory.glob("*.npy"))) == 3
+    assert len(index) == len(REACTIONS)
+    assert store.load()[0] == REACTIONS[:3] + REACTIONS[3:]
+
+
+def test_concurrent_writer_does_not_break_index(tmp_path):
+    dataset = tmp_path / "dataset.csv"
+    dataset.write_text("reactions")
+    directory = tmp_path / "store"
+    directory.mkdir()
+    store = ReactionFingerprintStore(directory, dataset)
+    other = ReactionFingerprintStore(directory, dataset)
+    other_fingerprints, _ = featurize(REACTIONS[3:])
+    save = store.save
+
+    def save_then_another_run_saves(*args):
+        stored = save(*args)
+        other.save(REACTIONS[3:], other_fingerprints, popcount(other_fingerprints), np.zeros((1,), dtype=bool))
+        return stored
+
+    store.save = save_then_another_run_saves
+    index = store.index(entries(REACTIONS[:2]))
+    assert index.top_k(REACTIONS[0], 1) == [1]
@@ -0,0 +1,51 @@
+"""``python -X importtime`` regression checks: only the provider and sampler named in the config are imported."""
+import subprocess
+import sys
+
+import pytest
+
+HEAVY = {"openai", "anthropic", "mistralai", "gigachat", "rdkit", "sklearn", "boto3"}
+
+SETUP = """
+from classifier.configuration import Configuration
+from classifier.providers.registry import create_provider
+from classifier.samplers.registry import create_sampler
+import classifier.completion_cache, classifier.plan, classifier.results, classifier.utils
+config = Configuration({{"provider": {provider!r}, "sampler": {sampler!r}, "api_url": "localhost:1",
+                         "name": "tester", "subject": "reaction", "engine": "gpt-4", "n_for_train": "2"}})
+{create}
+"""
+
+
+def imported_modules(code: str) -> dict[str, int]:
+    """Top-level packages imported by ``code``, with their cumulative import time in microseconds."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code], capture_output=True, text=True, check=True
+    )
+    modules = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line.removeprefix("import time:").split("|")
+        if cumulative.strip().isdigit():
+            top = name.strip().split(".")[0]
+            modules[top] = max(modules.get(top, 0), int(cumulative))
+    return modules
+
+
+def test_registries_import_no_provider_or_sampler():
+    modules = imported_modules(SETUP.format(provider="openai", sampler="simple", create=""))
+    assert not HEAVY & modules.keys()
+
+
+@pytest.mark.parametrize("provider, sampler, expected", [
+    ("openai", "simple", {"openai"}),
+    ("anthropic", "strict", {"anthropic"}),
+])
+def test_only_selected_provider_and_sampler_are_imported(provider, sampler, expected):
+    pytest.importorskip(provider)
+    code = SETUP.format(
+        provider=provider, sampler=sampler, create="create_provider(config); create_sampler(config)"
+    )
+    modules = imported_modules(code)
+    assert HEAVY & modules.keys() == expected
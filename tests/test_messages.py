@@ -0,0 +1,28 @@
+import json
+
+from benchmarks.bench_request_building import make_requests
+from benchmarks.bench_request_building import request_data_compiled
+from benchmarks.bench_request_building import request_data_rebuilt
+from benchmarks.bench_request_building import TEMPLATE
+from classifier.providers.messages import MessageCompiler
+
+
+def test_compiled_body_matches_json_dumps():
+    compiler = MessageCompiler("openai", TEMPLATE, name="tester")
+    for request in make_requests(50, 5, train_size=20):
+        data = request_data_compiled(compiler, request, "tester")
+        assert data == request_data_rebuilt(request, "tester")
+        assert compiler.body(data) == json.dumps(data).encode()
+
+
+def test_uncompiled_messages_are_serialized_too():
+    compiler = MessageCompiler("anthropic", "Системный промпт")
+    request = make_requests(1, 3)[0]
+    data = {"question": [{"type": "image"}], "request": compiler.messages(request.samples)}
+    data["request"].append({"role": "user", "content": [{"type": "text", "text": "ü", "cache_control": {}}]})
+    assert compiler.body(data) == json.dumps(data).encode()
+
+
+def test_yandex_dialect_uses_text_key():
+    compiler = MessageCompiler("yandex", "system")
+    assert compiler.messages([])[0] == {"role": "system", "text": "system"}
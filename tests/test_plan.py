@@ -0,0 +1,27 @@
+from classifier.dataset import DatasetEntry
+from classifier.plan import PlanEntry
+from classifier.plan import request_hash
+from classifier.plan import SamplingPlan
+from classifier.providers import CompletionRequest
+
+TRAIN = [DatasetEntry(f"input {i}", f"output {i}") for i in range(5)]
+
+
+def planned(train_indices: list[int]) -> PlanEntry:
+    request = CompletionRequest([TRAIN[i] for i in train_indices], "question", "gpt-4")
+    return PlanEntry(0, train_indices, request_hash(request))
+
+
+def test_plan_round_trip(tmp_path):
+    plan = SamplingPlan([planned([1, 3])])
+    plan.save(tmp_path / "plan.json")
+    entry = SamplingPlan.load(tmp_path / "plan.json")[0]
+    assert entry.request(TRAIN, "question", "gpt-4").samples == [TRAIN[1], TRAIN[3]]
+
+
+def test_stale_entries_are_detected():
+    entry = planned([1, 3])
+    assert entry.request(list(reversed(TRAIN)), "question", "gpt-4") is None
+    assert entry.request(TRAIN, "another question", "gpt-4") is None
+    assert entry.request(TRAIN, "question", "gpt-4o") is None
+    assert entry.request(TRAIN[:2], "question", "gpt-4") is None
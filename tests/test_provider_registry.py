@@ -0,0 +1,19 @@
+import pytest
+
+from classifier.dataset import DatasetEntry
+from classifier.providers import CompletionRequest
+from classifier.providers.registry import create_provider
+
+
+@pytest.mark.parametrize("provider_options", [{"name": "aleksei", "completion_cache": "true"}])
+def test_extra_options_keep_configured_name(provider_configuration):
+    request = CompletionRequest([DatasetEntry("a", "b")], "q", "gpt-4")
+
+    plain = create_provider(provider_configuration)._to_request_data(request)
+    extended = create_provider(
+        provider_configuration, {"completion_cache": None}, {"vision": False}
+    )._to_request_data(request)
+
+    assert extended == plain
+    assert extended["name"] == "aleksei"
+    assert extended["request"][1]["name"] == "aleksei"
@@ -0,0 +1,74 @@
+import json
+
+import pytest
+import requests
+
+from classifier.dataset import DatasetEntry
+from classifier.providers import CompletionRequest
+from classifier.providers.abstract_remote_execution_provider import InvalidResponseError
+
+COMPLETION = {
+    "id": "chatcmpl-1",
+    "object": "chat.completion",
+    "created": 0,
+    "model": "gpt-4",
+    "choices": [{
+        "index": 0,
+        "finish_reason": "stop",
+        "message": {"role": "assistant", "content": "high_yielding"},
+    }],
+    "usage": {"prompt_tokens": 10, "completion_tokens": 2, "total_tokens": 12},
+}
+
+
+def make_response(status: int, body) -> requests.Response:
+    response = requests.Response()
+    response.status_code = status
+    response._content = body if isinstance(body, bytes) else json.dumps(body).encode()
+    return response
+
+
+class FakeSession:
+    def __init__(self, *responses: requests.Response):
+        self.responses = list(responses)
+        self.calls = 0
+
+    def request(self, method, url, data=None):
+        self.calls += 1
+        return self.responses.pop(0)
+
+
+REQUEST = CompletionRequest([DatasetEntry("a", "b")], "q", "gpt-4")
+
+
+def test_client_error_fails_without_retry(provider):
+    provider._session = FakeSession(make_response(400, {"error": {"message": "bad request"}}))
+    with pytest.raises(requests.HTTPError, match="400"):
+        provider.get_completion(REQUEST)
+    assert provider._session.calls == 1
+
+
+def test_retryable_status_is_retried(provider):
+    provider._session = FakeSession(make_response(503, b""), make_response(200, COMPLETION))
+    assert provider.get_completion(REQUEST).text == "high_yielding"
+    assert provider._session.calls == 2
+
+
+def test_malformed_body_is_a_request_exception(provider):
+    provider._session = FakeSession(make_response(200, {"unexpected": True}))
+    with pytest.raises(InvalidResponseError):
+        provider.get_completion(REQUEST)
+    assert issubclass(InvalidResponseError, requests.RequestException)
+
+
+def test_prompt_cache_marks_depend_on_content_only(provider):
+    one = CompletionRequest([DatasetEntry("a", "b")], "q1", "gpt-4")
+    two = CompletionRequest([DatasetEntry("c", "d")], "q2", "gpt-4")
+    alternating = [one, two, one, two]
+    provider.expect(alternating)
+    keys = [provider._mark_prompt_cache(request, {})["prompt_cache_key"] for request in reversed(alternating)]
+    assert keys[0] == keys[2] and keys[1] == keys[3] and keys[0] != keys[1]
+
+    single = CompletionRequest([DatasetEntry("e", "f")], "q3", "gpt-4")
+    assert provider._shares_prefix(one)
+    assert not provider._shares_prefix(single)
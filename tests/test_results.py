@@ -0,0 +1,45 @@
+import json
+
+from classifier.dataset import DatasetEntry
+from classifier.results import read_answers
+from classifier.results import read_results
+from classifier.results import ResultsWriter
+
+
+def test_resume_after_torn_line(tmp_path):
+    path = tmp_path / "results.jsonl"
+    with ResultsWriter(path) as writer:
+        writer.write({"index": 0})
+    with open(path, "a") as file:
+        file.write(json.dumps({"index": 1})[:5])  # crash mid-write
+
+    with ResultsWriter(path) as writer:
+        writer.write({"index": 1})
+        writer.write({"index": 2})
+
+    assert [record["index"] for record in read_results(path)] == [0, 1, 2]
+
+
+def test_writer_appends_to_complete_file(tmp_path):
+    path = tmp_path / "results.jsonl"
+    for index in range(3):
+        with ResultsWriter(path) as writer:
+            writer.write({"index": index})
+    assert [record["index"] for record in read_results(path)] == [0, 1, 2]
+
+
+def test_answers_for_other_inputs_are_dropped(tmp_path):
+    path = tmp_path / "results.jsonl"
+    with ResultsWriter(path) as writer:
+        writer.write({"index": 0, "input": "a", "predicted_classes": ["x"]})
+        writer.write({"index": 1, "input": "old b", "predicted_classes": ["y"]})
+        writer.write({"index": 5, "input": "gone", "predicted_classes": ["z"]})
+
+    test = [DatasetEntry("a", "x"), DatasetEntry("b", "y")]
+    answered, stale = read_answers(path, test)
+    assert list(answered) == [0] and stale == 2
+
+    with ResultsWriter(path) as writer:
+        writer.write({"index": 1, "input": "b", "predicted_classes": ["y"]})
+    answered, _ = read_answers(path, test)
+    assert sorted(answered) == [0, 1]
@@ -0,0 +1,79 @@
+import threading
+
+import pytest
+
+boto3 = pytest.importorskip("boto3")
+moto = pytest.importorskip("moto")
+
+from classifier.s3storage import S3Storage
+
+
+@pytest.fixture
+def bucket(monkeypatch):
+    monkeypatch.setenv("AWS_DEFAULT_REGION", "us-east-1")
+    monkeypatch.setenv("S3_ACCESS_KEY", "testing")
+    monkeypatch.setenv("S3_SECRET_KEY", "testing")
+    monkeypatch.setenv("S3_ENDPOINT_URL", "https://s3.amazonaws.com")
+    monkeypatch.setenv("S3_BUCKET", "images")
+    with moto.mock_aws():
+        boto3.client("s3", region_name="us-east-1").create_bucket(Bucket="images")
+        yield
+
+
+def count_uploads(storage: S3Storage) -> list:
+    uploads = []
+    upload_file = storage.s3.upload_file
+
+    def counted(*args, **kwargs):
+        uploads.append(args)
+        return upload_file(*args, **kwargs)
+
+    storage.s3.upload_file = counted
+    return uploads
+
+
+def test_concurrent_stores_upload_once(bucket, tmp_path):
+    image = tmp_path / "reaction.png"
+    image.write_bytes(b"\x89PNG image")
+    storage = S3Storage(manifest_path=tmp_path / "uploaded.txt", workers=4)
+    uploads = count_uploads(storage)
+
+    barrier = threading.Barrier(5)
+    futures = []
+
+    def store():
+        barrier.wait()
+        futures.append(storage.store_async(image))
+
+    threads = [threading.Thread(target=store) for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len({future.result() for future in futures}) == 1
+    assert len(uploads) == 1
+
+
+def test_same_content_is_not_uploaded_again(bucket, tmp_path):
+    first, second = tmp_path / "a.png", tmp_path / "b.png"
+    first.write_bytes(b"same bytes")
+    second.write_bytes(b"same bytes")
+
+    url = S3Storage().store(first)
+
+    # No manifest: the object is found with head_object.
+    fresh = S3Storage()
+    uploads = count_uploads(fresh)
+    assert fresh.store(second) == url
+    assert uploads == []
+
+
+def test_manifest_skips_head_object(bucket, tmp_path):
+    image = tmp_path / "reaction.png"
+    image.write_bytes(b"\x89PNG image")
+    url = S3Storage(manifest_path=tmp_path / "uploaded.txt").store(image)
+
+    storage = S3Storage(manifest_path=tmp_path / "uploaded.txt")
+    storage.s3.head_object = storage.s3.upload_file = None  # must not be called
+    assert storage.store(image) == url
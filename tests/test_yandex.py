@@ -0,0 +1,86 @@
+import json
+
+import pytest
+import requests
+
+import classifier.providers.yandex_provider as yandex_provider
+from classifier.configuration import Configuration
+from classifier.dataset import DatasetEntry
+from classifier.providers import CompletionRequest
+from classifier.providers.registry import create_provider
+from classifier.providers.yandex_provider import OperationPoller
+from classifier.templates import zero_shot_template
+
+
+def make_response(status: int, body) -> requests.Response:
+    response = requests.Response()
+    response.status_code = status
+    response._content = json.dumps(body).encode()
+    return response
+
+
+class FakeSession:
+    def __init__(self, *responses: requests.Response):
+        self.responses = list(responses)
+
+    def get(self, url, headers=None):
+        return self.responses.pop(0) if len(self.responses) > 1 else self.responses[0]
+
+
+def test_poller_fails_operation_on_client_error():
+    poller = OperationPoller(FakeSession(make_response(404, {"message": "Operation not found"})), 0.001, 0.01)
+    with pytest.raises(requests.HTTPError, match="404"):
+        poller.track("lost").result(timeout=5)
+
+
+def test_poller_backs_off_on_throttling():
+    done = {"id": "op", "done": True, "response": {}}
+    poller = OperationPoller(
+        FakeSession(make_response(429, {}), make_response(503, {}), make_response(200, done)), 0.001, 0.01
+    )
+    assert poller.track("op").result(timeout=5) == done
+
+
+class RecordingLimiter:
+    def __init__(self):
+        self.released = []
+
+    def acquire(self, tokens):
+        pass
+
+    def release(self, status, latency):
+        self.released.append(status)
+
+
+class FakeLLMSession:
+    def __init__(self, response: requests.Response):
+        self.response = response
+
+    def post(self, url, json=None, headers=None):
+        return self.response
+
+
+@pytest.fixture
+def yandex(monkeypatch):
+    monkeypatch.setattr(yandex_provider, "count_prompt_tokens", lambda system, request: 10)
+    provider = create_provider(Configuration({
+        "provider": "yandex", "subject": next(iter(zero_shot_template)), "engine": "yandexgpt",
+    }))
+    provider._YandexGPTCompletionProvider__rate_limiter = RecordingLimiter()
+    return provider
+
+
+def test_throttled_submit_is_a_request_error(yandex):
+    yandex._YandexGPTCompletionProvider__llm_session = FakeLLMSession(make_response(429, {"error": "throttled"}))
+    with pytest.raises(requests.HTTPError, match="429"):
+        yandex.submit(CompletionRequest([DatasetEntry("a", "b")], "q", "yandexgpt"))
+    assert yandex._YandexGPTCompletionProvider__rate_limiter.released == [429]
+
+
+def test_failed_operation_is_a_request_error(yandex):
+    yandex._YandexGPTCompletionProvider__llm_session = FakeLLMSession(
+        make_response(200, {"id": "op", "done": True, "error": {"code": 3}})
+    )
+    future = yandex.submit(CompletionRequest([DatasetEntry("a", "b")], "q", "yandexgpt"))
+    with pytest.raises(requests.RequestException):
+        future.result(timeout=5)